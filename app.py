@@ -1,26 +1,227 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response, abort, Response, stream_with_context, send_from_directory, g, has_request_context
+from flask import template_rendered, before_render_template
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
 from werkzeug.security import check_password_hash, generate_password_hash
-from datetime import datetime
-import qrcode
+from werkzeug.utils import safe_join
+from datetime import datetime, timedelta, timezone
+import click
 import io
-import base64
+import csv
+import json
+import gzip
 import os
+import posixpath
+import mimetypes
+import re
+import sqlite3
+import sys
+import tempfile
 import uuid
+import threading
+import bisect
+import time
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import wraps
+from jinja2 import FileSystemBytecodeCache
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'ukr-drone-federation-secure-key-2024')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:////tmp/pilots.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Пул соединений PostgreSQL на процесс воркера: размер, переполнение, ожидание свободного соединения
+# и время жизни соединения (секунды) - меньше таймаута простоя на стороне БД/прокси
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+
+# Реплика только для чтения для публичных страниц (пустое значение - все запросы идут в основную БД)
+# и допустимое отставание реплики в секундах: столько после своей записи администратор читает из основной БД,
+# а реплика, отставшая сильнее, временно не используется
+app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL', '')
+app.config['REPLICA_LAG_TOLERANCE'] = float(os.environ.get('REPLICA_LAG_TOLERANCE', 5))
+
+# Как часто (в секундах) воркер сверяет свой кэш рейтинга с версией данных в БД
+app.config['DATA_VERSION_CHECK_INTERVAL'] = float(os.environ.get('DATA_VERSION_CHECK_INTERVAL', 5))
+
+# Кэширование публичных страниц (рейтинг, профиль) клиентом/CDN: max-age и stale-while-revalidate в секундах
+app.config['PAGE_CACHE_MAX_AGE'] = int(os.environ.get('PAGE_CACHE_MAX_AGE', 60))
+app.config['PAGE_STALE_WHILE_REVALIDATE'] = int(os.environ.get('PAGE_STALE_WHILE_REVALIDATE', 600))
+
+# Кэш отрендеренных статических страниц (главная, поддержка): количество страниц в памяти воркера
+# и необязательный общий для воркеров каталог на диске (пустое значение - только память)
+app.config['RENDERED_PAGE_CACHE_SIZE'] = int(os.environ.get('RENDERED_PAGE_CACHE_SIZE', 32))
+app.config['RENDERED_PAGE_CACHE_DIR'] = os.environ.get('RENDERED_PAGE_CACHE_DIR', '')
+
+# Каталог байткод-кэша Jinja: скомпилированные шаблоны переживают перезапуск воркеров (пустое значение - отключен)
+app.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get('JINJA_BYTECODE_CACHE_DIR', '/tmp/jinja_bytecode_cache')
+
+# Сколько секунд клиент кэширует собранные статические файлы (имена содержат хэш содержимого)
+app.config['ASSET_CACHE_MAX_AGE'] = int(os.environ.get('ASSET_CACHE_MAX_AGE', 31536000))
+
+# Базовый URL, который кодируется в QR-кодах участников
+app.config['BASE_URL'] = os.environ.get('BASE_URL', 'https://ufmup.com')
+
+# Сколько PNG QR-кодов держать в памяти воркера и сколько секунд их кэширует клиент
+app.config['QR_CACHE_SIZE'] = int(os.environ.get('QR_CACHE_SIZE', 2048))
+app.config['QR_CACHE_MAX_AGE'] = int(os.environ.get('QR_CACHE_MAX_AGE', 31536000))
+
+# Количество карточек участников на одной странице админ-панели
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 24))
+
+# Время жизни (в секундах) кэша статистики админ-панели
+app.config['DASHBOARD_STATS_TTL'] = float(os.environ.get('DASHBOARD_STATS_TTL', 30))
+
+# Минимальное количество цифр в ID участника (UAV-0001); номера длиннее ширины не обрезаются
+app.config['PARTICIPANT_ID_WIDTH'] = int(os.environ.get('PARTICIPANT_ID_WIDTH', 4))
+
+# Размер пачки строк при импорте участников из CSV (одна транзакция и одна запись в журнале на пачку)
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+
+# Количество потоков для фоновых задач воркера (генерация QR-кодов после импорта)
+app.config['BACKGROUND_WORKERS'] = int(os.environ.get('BACKGROUND_WORKERS', 2))
+
+# Метрики /metrics: каталог снимков воркеров gunicorn (пустое значение - только текущий процесс),
+# как часто воркер обновляет свой снимок (секунды) и необязательный Bearer-токен для доступа
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', '')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+
+# Профилирование SQL (разработка/CI): заголовки X-Query-Count и Server-Timing, сводка по каждому запросу в лог
+# и, если задан каталог, в NDJSON-файлы; с какого числа одинаковых запросов сообщать о возможном N+1
+app.config['SQL_PROFILE'] = os.environ.get('SQL_PROFILE', '').lower() in ('1', 'true', 'yes')
+app.config['SQL_PROFILE_DIR'] = os.environ.get('SQL_PROFILE_DIR', '')
+app.config['SQL_PROFILE_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('SQL_PROFILE_N_PLUS_ONE_THRESHOLD', 5))
+
+# Максимальный размер загружаемого фото участника (байты)
+app.config['PHOTO_UPLOAD_MAX_BYTES'] = int(os.environ.get('PHOTO_UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+
+# Журнал активности: размер страницы, срок хранения в основной таблице (дни) и каталог архива
+app.config['ACTIVITY_PAGE_SIZE'] = int(os.environ.get('ACTIVITY_PAGE_SIZE', 50))
+app.config['ACTIVITY_RETENTION_DAYS'] = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 365))
+app.config['ACTIVITY_ARCHIVE_DIR'] = os.environ.get('ACTIVITY_ARCHIVE_DIR', os.path.join('archive', 'activity'))
+
 # Настройки безопасности сессии
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 час в секундах
 app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'  # True для HTTPS в продакшене
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Защита от XSS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Защита от CSRF
 
-db = SQLAlchemy(app)
+REPLICA_BIND = 'replica'
+
+class RoutingSession(FlaskSession):
+    """Сессия БД, которая в запросах, помеченных read_from_replica, отправляет чтения на реплику.
+
+    Запись - ORM flush, INSERT/UPDATE/DELETE через execute и текстовый SQL, кроме SELECT, - всегда идет
+    в основную БД, и после первой записи вся сессия (то есть остаток запроса) читает тоже из нее.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and (self._flushing or is_write_statement(clause)):
+            self.info['wrote_to_primary'] = True
+        if (bind is None and not self.info.get('wrote_to_primary')
+                and current_read_bind() == REPLICA_BIND):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+# SELECT, который меняет состояние последовательностей (аллокатор ID участников в PostgreSQL)
+SEQUENCE_WRITE_FUNCTIONS = re.compile(r'\b(nextval|setval)\s*\(', re.IGNORECASE)
+
+def is_write_statement(clause):
+    """INSERT/UPDATE/DELETE или текстовый SQL, не начинающийся с SELECT либо вызывающий nextval/setval"""
+    if isinstance(clause, UpdateBase):
+        return True
+    if not isinstance(clause, TextClause):
+        return False
+    return (not clause.text.lstrip().upper().startswith('SELECT')
+            or SEQUENCE_WRITE_FUNCTIONS.search(clause.text) is not None)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def normalize_database_uri(database_uri):
+    """Heroku и некоторые хостинги отдают устаревшую схему postgres://, которую SQLAlchemy 2 не принимает"""
+    if database_uri.startswith('postgres://'):
+        return 'postgresql://' + database_uri[len('postgres://'):]
+    return database_uri
+
+def engine_options(database_uri):
+    """Параметры движка SQLAlchemy: настроенный пул для PostgreSQL, настройки по умолчанию для SQLite"""
+    if not database_uri.startswith('postgres'):
+        return {}
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+def create_app(config=None, precompile_templates=False):
+    """Фабрика приложения: подключает БД и кэши шаблонов и страниц.
+
+    Маршруты регистрируются при импорте модуля, а БД подключает только фабрика: импорт app.py ничего
+    не открывает и не компилирует. Приложение в модуле одно, поэтому повторный вызов возвращает его же,
+    а попытка передать другую конфигурацию после подключения БД - ошибка.
+    precompile_templates=True компилирует все шаблоны заранее: с gunicorn --preload это происходит
+    один раз в мастер-процессе, и воркеры получают готовые шаблоны через fork (см. Procfile).
+    """
+    if 'sqlalchemy' in app.extensions:
+        conflicting = sorted(key for key, value in (config or {}).items()
+                             if app.config.get(key) != _normalize_config_value(key, value))
+        if conflicting:
+            raise RuntimeError(f"Приложение уже создано с другой конфигурацией: {', '.join(conflicting)}")
+        if precompile_templates:
+            _precompile_templates()
+        return app
+    
+    if config:
+        app.config.update(config)
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(database_uri))
+    if app.config['DATABASE_REPLICA_URL']:
+        # Реплика - отдельный bind без моделей: create_all/drop_all ее не трогают
+        replica_uri = app.config['DATABASE_REPLICA_URL'] = normalize_database_uri(app.config['DATABASE_REPLICA_URL'])
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = {'url': replica_uri, **engine_options(replica_uri)}
+    db.init_app(app)
+    
+    if app.config['JINJA_BYTECODE_CACHE_DIR']:
+        os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+    if app.config['RENDERED_PAGE_CACHE_DIR']:
+        rendered_page_cache.tiers.append(FilePageCache(app.config['RENDERED_PAGE_CACHE_DIR']))
+    
+    if precompile_templates:
+        _precompile_templates()
+    
+    # Соединения, открытые до fork, не должны использоваться несколькими процессами
+    os.register_at_fork(after_in_child=_dispose_engine_after_fork)
+    return app
+
+def _normalize_config_value(key, value):
+    """Значение конфигурации в том виде, в каком его сохраняет create_app (для сравнения при повторном вызове)"""
+    if key in ('SQLALCHEMY_DATABASE_URI', 'DATABASE_REPLICA_URL') and value:
+        return normalize_database_uri(value)
+    return value
+
+def _precompile_templates():
+    """Компилирует все шаблоны: с --preload воркеры разделяют их с мастером (copy-on-write)"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+def _dispose_engine_after_fork():
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
 
 # Декоратор для проверки авторизации админа
 def admin_required(f):
@@ -32,44 +233,121 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Аллокатор ID участников: отдельная таблица-счетчик (SQLite) или нативная последовательность (PostgreSQL)
+PARTICIPANT_ID_COUNTER = 'participant'
+PARTICIPANT_ID_SEQUENCE = 'participant_number_seq'
+
+_id_allocator_ready = False
+
+def format_participant_id(number):
+    """Форматирует номер в ID участника (UAV-0001)"""
+    return f"UAV-{number:0{app.config['PARTICIPANT_ID_WIDTH']}d}"
+
+def parse_participant_number(value):
+    """Возвращает номер из ID вида UAV-0001 или None"""
+    if value and value.startswith('UAV-'):
+        try:
+            return int(value.split('-')[1])
+        except (IndexError, ValueError):
+            return None
+    return None
+
+def is_valid_participant_id(value):
+    """Проверяет формат ID участника с учетом настроенной ширины номера"""
+    width = app.config['PARTICIPANT_ID_WIDTH']
+    return re.match(rf'^UAV-\d{{{width},}}$', value) is not None
+
+def _uses_native_sequence():
+    return db.engine.dialect.name == 'postgresql'
+
+def _max_existing_participant_number():
+    """Максимальный номер среди ID обеих таблиц (читаются только колонки ID)"""
+    max_number = 0
+    for column in (Participant.participant_id, Pilot.pilot_id):
+        for (value,) in db.session.execute(db.select(column).where(column.like('UAV-%'))):
+            number = parse_participant_number(value)
+            if number is not None and number > max_number:
+                max_number = number
+    return max_number
+
+def ensure_id_allocator():
+    """Один раз инициализирует счетчик ID значением текущего максимума.
+
+    Отметка готовности ставится только после commit этой транзакции (см. _mark_id_allocator_ready):
+    если транзакция откатится вместе с созданной последовательностью, инициализация повторится.
+    """
+    if _id_allocator_ready:
+        return
+
+    if _uses_native_sequence():
+        db.session.execute(db.text(f"CREATE SEQUENCE IF NOT EXISTS {PARTICIPANT_ID_SEQUENCE}"))
+
+    if db.session.get(IdCounter, PARTICIPANT_ID_COUNTER) is None:
+        seed = _max_existing_participant_number()
+        try:
+            # Строка счетчика служит отметкой "уже засеяно"; параллельный воркер получит IntegrityError
+            with db.session.begin_nested():
+                db.session.add(IdCounter(name=PARTICIPANT_ID_COUNTER, value=seed))
+                db.session.flush()
+                if _uses_native_sequence() and seed > 0:
+                    db.session.execute(db.text("SELECT setval(:seq, :value)"),
+                                       {'seq': PARTICIPANT_ID_SEQUENCE, 'value': seed})
+            print(f"Счетчик ID участников инициализирован значением {seed}")
+        except IntegrityError:
+            pass
+
+    db.session.info['id_allocator_initialized'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _mark_id_allocator_ready(session):
+    global _id_allocator_ready
+    if session.info.pop('id_allocator_initialized', False):
+        _id_allocator_ready = True
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_id_allocator_after_rollback(session):
+    session.info.pop('id_allocator_initialized', None)
+
+def allocate_participant_numbers(count=1):
+    """Атомарно выделяет count новых номеров ID. Commit выполняет вызывающий код."""
+    global _id_allocator_ready
+    ensure_id_allocator()
+
+    if _uses_native_sequence():
+        rows = db.session.execute(
+            db.text("SELECT nextval(:seq) FROM generate_series(1, :count)"),
+            {'seq': PARTICIPANT_ID_SEQUENCE, 'count': count}
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    last = db.session.execute(
+        db.text("UPDATE id_counter SET value = value + :count WHERE name = :name RETURNING value"),
+        {'count': count, 'name': PARTICIPANT_ID_COUNTER}
+    ).scalar()
+    if last is None:
+        # Строки счетчика нет (инициализация откатилась вместе с транзакцией) - засеваем заново
+        _id_allocator_ready = False
+        return allocate_participant_numbers(count)
+    return list(range(last - count + 1, last + 1))
+
+def advance_participant_id_counter(number):
+    """Сдвигает счетчик вперед после ручного назначения ID, чтобы автогенерация его не повторила"""
+    ensure_id_allocator()
+
+    if _uses_native_sequence():
+        db.session.execute(
+            db.text(f"SELECT setval(:seq, :value) WHERE :value > (SELECT last_value FROM {PARTICIPANT_ID_SEQUENCE})"),
+            {'seq': PARTICIPANT_ID_SEQUENCE, 'value': number}
+        )
+    else:
+        db.session.execute(
+            db.text("UPDATE id_counter SET value = MAX(value, :value) WHERE name = :name"),
+            {'value': number, 'name': PARTICIPANT_ID_COUNTER}
+        )
+
 # Функция для генерации следующего ID участника
 def generate_next_participant_id():
-    try:
-        # Получаем все ID из обеих таблиц
-        participant_ids = []
-        
-        # Новые участники
-        participants = Participant.query.all()
-        for p in participants:
-            if p.participant_id and p.participant_id.startswith('UAV-'):
-                try:
-                    num = int(p.participant_id.split('-')[1])
-                    participant_ids.append(num)
-                except:
-                    continue
-        
-        # Старые пилоты
-        pilots = Pilot.query.all()
-        for p in pilots:
-            if p.pilot_id and p.pilot_id.startswith('UAV-'):
-                try:
-                    num = int(p.pilot_id.split('-')[1])
-                    participant_ids.append(num)
-                except:
-                    continue
-        
-        # Находим следующий доступный номер
-        if participant_ids:
-            next_number = max(participant_ids) + 1
-        else:
-            next_number = 1
-            
-    except Exception as e:
-        print(f"Ошибка при генерации ID: {e}")
-        # Если ошибка, начинаем с 1
-        next_number = 1
-        
-    return f"UAV-{next_number:04d}"
+    return format_participant_id(allocate_participant_numbers(1)[0])
 
 # Для обратной совместимости
 def generate_next_pilot_id():
@@ -143,6 +421,13 @@ CATEGORIES = {
     }
 }
 
+def is_pilot_subcategory(category, subcategory):
+    """Проверяет, относится ли подкатегория к пилотам (для системы очков и публичного рейтинга)"""
+    return (category == 'military' and 
+            subcategory in ['pilot_strike', 'pilot_reconnaissance']) or \
+           (category == 'civil' and 
+            subcategory == 'pilot')
+
 # Новая модель участников
 class Participant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -156,6 +441,10 @@ class Participant(db.Model):
     qr_code = db.Column(db.String(100), unique=True)
     is_active = db.Column(db.Boolean, default=True, nullable=False)  # Статус активации ID карты
     
+    __table_args__ = (
+        db.Index('ix_participant_category_subcategory_points', 'category', 'subcategory', 'points'),
+    )
+    
     def __repr__(self):
         return f'<Participant {self.callsign}>'
     
@@ -171,10 +460,7 @@ class Participant(db.Model):
     
     def is_pilot(self):
         """Проверяет, является ли участник пилотом (для системы очков и публичного рейтинга)"""
-        return (self.category == 'military' and 
-                self.subcategory in ['pilot_strike', 'pilot_reconnaissance']) or \
-               (self.category == 'civil' and 
-                self.subcategory == 'pilot')
+        return is_pilot_subcategory(self.category, self.subcategory)
     
     def get_pilot_category(self):
         """Возвращает категорию пилота для совместимости"""
@@ -195,9 +481,21 @@ class Pilot(db.Model):
     points = db.Column(db.Integer, default=0)
     qr_code = db.Column(db.String(100), unique=True)
     
+    __table_args__ = (
+        db.Index('ix_pilot_category_points', 'category', 'points'),
+    )
+    
     def __repr__(self):
         return f'<Pilot {self.callsign}>'
 
+# Индексы под порядок списка участников (очки по убыванию, затем id) - выражение совпадает с member_table
+MEMBER_ORDER_INDEXES = [
+    ('ix_participant_points_id', 'participant', 'coalesce(points, 0) DESC, id'),
+    ('ix_pilot_points_id', 'pilot', 'coalesce(points, 0) DESC, id'),
+]
+db.Index('ix_participant_points_id', db.func.coalesce(Participant.points, db.literal_column('0')).desc(), Participant.id)
+db.Index('ix_pilot_points_id', db.func.coalesce(Pilot.points, db.literal_column('0')).desc(), Pilot.id)
+
 class Achievement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     # Для новых участников
@@ -211,6 +509,11 @@ class Achievement(db.Model):
     participant = db.relationship('Participant', backref=db.backref('achievements', lazy=True))
     pilot = db.relationship('Pilot', backref=db.backref('achievements', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_achievement_participant_date', 'participant_id', 'date_awarded'),
+        db.Index('ix_achievement_pilot_date', 'pilot_id', 'date_awarded'),
+    )
+    
     def get_owner(self):
         """Возвращает владельца достижения (участника или пилота)"""
         return self.participant or self.pilot
@@ -232,6 +535,14 @@ class AdminActivityLog(db.Model):
     participant = db.relationship('Participant', backref=db.backref('activity_logs', lazy=True))
     pilot = db.relationship('Pilot', backref=db.backref('activity_logs', lazy=True))
     
+    # Индексы под keyset-пагинацию по (timestamp, id), в том числе с фильтрами по типу действия и участнику
+    __table_args__ = (
+        db.Index('ix_admin_activity_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_admin_activity_log_action_timestamp_id', 'action_type', 'timestamp', 'id'),
+        db.Index('ix_admin_activity_log_participant_timestamp_id', 'participant_name', 'timestamp', 'id'),
+        db.Index('ix_admin_activity_log_pilot_timestamp_id', 'pilot_name', 'timestamp', 'id'),
+    )
+    
     def get_owner(self):
         """Возвращает владельца лога (участника или пилота)"""
         return self.participant or self.pilot
@@ -240,370 +551,1992 @@ class AdminActivityLog(db.Model):
         """Возвращает имя владельца лога"""
         return self.participant_name or self.pilot_name
 
+# Глобальная версия данных (одна строка с id=1), общая для всех воркеров gunicorn
+class DataVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<DataVersion {self.version}>'
+
+# Счетчик последнего выданного номера ID участника
+class IdCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<IdCounter {self.name}={self.value}>'
+
+# Примененные шаги миграций схемы (см. MIGRATIONS)
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+# Прогресс пакетных миграций данных: последний обработанный id для каждой миграции
+class MigrationCheckpoint(db.Model):
+    __tablename__ = 'migration_checkpoint'
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<MigrationCheckpoint {self.name}={self.last_id}>'
+
+PILOT_MIGRATION_CHECKPOINT = 'pilots_to_participants'
+
 # Функция для логирования активности админки
 def log_admin_activity(action_type, participant=None, pilot=None, description=None, points_awarded=None):
-    # Приоритет отдаем participant
-    if participant:
-        participant_name = participant.callsign
-        participant_id = participant.id
-        pilot_name = None
-        pilot_id = None
-    elif pilot:
-        participant_name = None
-        participant_id = None
-        pilot_name = pilot.callsign
-        pilot_id = pilot.id
-    else:
-        participant_name = None
-        participant_id = None
-        pilot_name = None
-        pilot_id = None
-    
+    """Добавляет запись журнала в текущую сессию. Commit выполняет вызывающий код.
+
+    Запись сохраняется в той же транзакции, что и само изменение: без отдельного
+    commit и только если изменение действительно сохранено. participant/pilot может
+    быть ORM-объектом (в том числе еще не сохраненным) или строкой с полями id и callsign.
+    """
     log = AdminActivityLog(
         action_type=action_type,
-        participant_id=participant_id,
-        participant_name=participant_name,
-        pilot_id=pilot_id,
-        pilot_name=pilot_name,
-        description=description,
+        description=(description or '')[:AdminActivityLog.description.type.length],
         points_awarded=points_awarded
     )
     
+    # Приоритет отдаем participant
+    if participant is not None:
+        log.participant_name = participant.callsign
+        if isinstance(participant, Participant):
+            log.participant = participant
+        else:
+            log.participant_id = participant.id
+    elif pilot is not None:
+        log.pilot_name = pilot.callsign
+        if isinstance(pilot, Pilot):
+            log.pilot = pilot
+        else:
+            log.pilot_id = pilot.id
+    
     db.session.add(log)
-    db.session.commit()
+    return log
 
-# Маршруты
-@app.route('/')
-def index():
-    return render_template('index.html')
+# Начисление очков одним атомарным UPDATE (безопасно для нескольких воркеров gunicorn)
+def award_points(model, member_pk, delta):
+    """Изменяет очки участника (Participant) или старого пилота (Pilot) на delta.
 
-@app.route('/support')
-def support():
-    return render_template('support.html')
+    Выполняется как UPDATE ... SET points = points + :delta в текущей транзакции,
+    без чтения строки в Python; commit выполняет вызывающий код.
+    Возвращает False, если строка не найдена.
+    """
+    result = db.session.execute(
+        db.update(model)
+        .where(model.id == member_pk)
+        .values(points=db.func.coalesce(model.points, 0) + delta)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
 
-@app.route('/rating')
-def rating():
-    # Получаем только пилотов (для публичного рейтинга)
-    # Новые участники-пилоты (приоритет) - включаем военных и гражданских
-    new_strike_pilots = Participant.query.filter_by(category='military', subcategory='pilot_strike').order_by(Participant.points.desc()).all()
-    new_recon_pilots = Participant.query.filter_by(category='military', subcategory='pilot_reconnaissance').order_by(Participant.points.desc()).all()
-    
-    # Добавляем гражданских пилотов (они считаются как ударные для рейтинга)
-    civil_pilots = Participant.query.filter_by(category='civil', subcategory='pilot').order_by(Participant.points.desc()).all()
-    new_strike_pilots.extend(civil_pilots)
-    
-    # Получаем QR коды новых участников для исключения дубликатов
-    migrated_qr_codes = set()
-    for pilot in new_strike_pilots + new_recon_pilots:
-        if pilot.qr_code:
-            migrated_qr_codes.add(pilot.qr_code)
-    
-    # Старые пилоты (только те, которые не были мигрированы)
-    old_strike_pilots = [p for p in Pilot.query.filter_by(category='strike').order_by(Pilot.points.desc()).all() 
-                        if p.qr_code not in migrated_qr_codes]
-    old_recon_pilots = [p for p in Pilot.query.filter_by(category='reconnaissance').order_by(Pilot.points.desc()).all() 
-                       if p.qr_code not in migrated_qr_codes]
-    
-    # Объединяем списки и сортируем каждый по очкам
-    strike_pilots = list(new_strike_pilots) + list(old_strike_pilots)
-    strike_pilots.sort(key=lambda x: x.points, reverse=True)
-    
-    recon_pilots = list(new_recon_pilots) + list(old_recon_pilots)
-    recon_pilots.sort(key=lambda x: x.points, reverse=True)
-    
-    all_pilots = strike_pilots + recon_pilots
-    
-    # Сортируем общий список по очкам
-    all_pilots.sort(key=lambda x: x.points, reverse=True)
-    
-    return render_template('rating.html', 
-                         all_pilots=all_pilots,
-                         strike_pilots=strike_pilots,
-                         recon_pilots=recon_pilots)
+def add_achievement(model, member_pk, description, points, award=True):
+    """Добавляет достижение участнику или старому пилоту и, если award, начисляет очки в той же транзакции"""
+    owner_column = 'participant_id' if model is Participant else 'pilot_id'
+    db.session.add(Achievement(description=description, points=points, **{owner_column: member_pk}))
+    if award and points:
+        award_points(model, member_pk, points)
+    bump_data_version()
 
-@app.route('/pilot/<string:qr_code>')
-def pilot_profile(qr_code):
-    # Пробуем найти среди новых участников
-    participant = Participant.query.filter_by(qr_code=qr_code).first()
-    if participant:
-        achievements = Achievement.query.filter_by(participant_id=participant.id).order_by(Achievement.date_awarded.desc()).all()
-        
-        # Для участников - получаем только пилотов для рейтинга
-        all_strike_pilots = Participant.query.filter_by(category='military', subcategory='pilot_strike').order_by(Participant.points.desc()).all()
-        all_recon_pilots = Participant.query.filter_by(category='military', subcategory='pilot_reconnaissance').order_by(Participant.points.desc()).all()
-        
-        # Добавляем старых пилотов для совместимости
-        old_strike_pilots = Pilot.query.filter_by(category='strike').order_by(Pilot.points.desc()).all()
-        old_recon_pilots = Pilot.query.filter_by(category='reconnaissance').order_by(Pilot.points.desc()).all()
-        
-        all_strike_pilots.extend(old_strike_pilots)
-        all_recon_pilots.extend(old_recon_pilots)
-        
-        # Подсчитываем дни в федерации
-        days_in_federation = (datetime.now() - participant.join_date).days
-        
-        return render_template('pilot_profile.html', 
-                             pilot=participant,  # Передаем как pilot для совместимости шаблона
-                             achievements=achievements,
-                             all_strike_pilots=all_strike_pilots,
-                             all_recon_pilots=all_recon_pilots,
-                             days_in_federation=days_in_federation)
-    
-    # Если не найден среди участников, ищем среди старых пилотов
-    pilot = Pilot.query.filter_by(qr_code=qr_code).first_or_404()
-    
-    achievements = Achievement.query.filter_by(pilot_id=pilot.id).order_by(Achievement.date_awarded.desc()).all()
-    
-    # Получаем списки для определения места в категории
-    all_strike_pilots = Pilot.query.filter_by(category='strike').order_by(Pilot.points.desc()).all()
-    all_recon_pilots = Pilot.query.filter_by(category='reconnaissance').order_by(Pilot.points.desc()).all()
-    
-    # Добавляем новых участников-пилотов
-    new_strike_pilots = Participant.query.filter_by(category='military', subcategory='pilot_strike').order_by(Participant.points.desc()).all()
-    new_recon_pilots = Participant.query.filter_by(category='military', subcategory='pilot_reconnaissance').order_by(Participant.points.desc()).all()
-    
-    all_strike_pilots.extend(new_strike_pilots)
-    all_recon_pilots.extend(new_recon_pilots)
-    
-    # Подсчитываем дни в федерации
-    days_in_federation = (datetime.now() - pilot.join_date).days
-    
-    return render_template('pilot_profile.html', 
-                         pilot=pilot, 
-                         achievements=achievements,
-                         all_strike_pilots=all_strike_pilots,
-                         all_recon_pilots=all_recon_pilots,
-                         days_in_federation=days_in_federation)
+# Версия данных: увеличивается в той же транзакции, что и изменение очков или состава участников
+def bump_data_version():
+    """Увеличивает версию данных. Commit выполняет вызывающий код."""
+    result = db.session.execute(
+        db.update(DataVersion)
+        .where(DataVersion.id == 1)
+        .values(version=DataVersion.version + 1, updated_at=datetime.now())
+    )
+    if result.rowcount == 0:
+        db.session.add(DataVersion(id=1, version=1))
+    # Локальные кэши сбросим после успешного commit (см. _invalidate_after_commit)
+    db.session.info['data_changed'] = True
 
-@app.route('/admin/login', methods=['GET', 'POST'])
-def admin_login():
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        
-        admin_username = os.environ.get('ADMIN_USERNAME', 'admin13')
-        admin_password = os.environ.get('ADMIN_PASSWORD', 'admin1313')
-        
-        if username == admin_username and password == admin_password:
-            session.permanent = True  # Применить тайм-аут сессии
-            session['admin'] = True
-            flash('Успешна авторизация!')
-            return redirect(url_for('admin_dashboard'))
-        else:
-            flash('Неверные данные для входа')
-    
-    return render_template('admin_login.html')
+def get_data_version():
+    """Возвращает текущую версию данных (0, если строка еще не создана)"""
+    return data_version_cache.get()[0]
 
-@app.route('/admin')
-@admin_required
-def admin_dashboard():
-    
-    # Получаем статистику участников
-    total_participants = Participant.query.count()
-    total_pilots_old = Pilot.query.count()  # Старые пилоты
-    total_all = total_participants + total_pilots_old
-    
-    # Статистика активации карт (только для новых участников)
-    active_cards = Participant.query.filter_by(is_active=True).count()
-    inactive_cards = Participant.query.filter_by(is_active=False).count()
-    
-    # Статистика по категориям новых участников
-    military_count = Participant.query.filter_by(category='military').count()
-    civil_count = Participant.query.filter_by(category='civil').count()
-    deftech_count = Participant.query.filter_by(category='deftech').count()
-    donor_partner_count = Participant.query.filter_by(category='donor_partner').count()
-    media_education_count = Participant.query.filter_by(category='media_education').count()
-    
-    # Статистика пилотов (для совместимости)
-    strike_pilots_old = Pilot.query.filter_by(category='strike').count()
-    recon_pilots_old = Pilot.query.filter_by(category='reconnaissance').count()
-    strike_pilots_new = Participant.query.filter_by(category='military', subcategory='pilot_strike').count()
-    recon_pilots_new = Participant.query.filter_by(category='military', subcategory='pilot_reconnaissance').count()
-    
-    total_strike_pilots = strike_pilots_old + strike_pilots_new
-    total_recon_pilots = recon_pilots_old + recon_pilots_new
-    
-    # Получаем всех участников для отображения
-    all_participants = Participant.query.order_by(Participant.points.desc()).all()
-    all_pilots_old = Pilot.query.order_by(Pilot.points.desc()).all()
-    
-    # Объединяем для отображения (приоритет новым участникам)
-    all_members = list(all_participants) + list(all_pilots_old)
-    
-    # Получаем всех участников для поиска и преобразуем в словари
-    all_members_data = []
-    
-    # Новые участники
-    for participant in all_participants:
-        member_data = {
-            'id': participant.id,
-            'participant_id': participant.participant_id,
-            'callsign': participant.callsign,
-            'category': participant.category,
-            'subcategory': participant.subcategory,
-            'points': participant.points,
-            'photo_url': participant.photo_url,
-            'join_date': participant.join_date.strftime('%d.%m.%Y'),
-            'achievements': [{'description': ach.description, 'points': ach.points} for ach in participant.achievements],
-            'type': 'participant'
-        }
-        all_members_data.append(member_data)
-    
-    # Старые пилоты
-    for pilot in all_pilots_old:
-        member_data = {
-            'id': pilot.id,
-            'pilot_id': pilot.pilot_id,
-            'callsign': pilot.callsign,
-            'category': pilot.category,
-            'subcategory': None,
-            'points': pilot.points,
-            'photo_url': pilot.photo_url,
-            'join_date': pilot.join_date.strftime('%d.%m.%Y'),
-            'achievements': [{'description': ach.description, 'points': ach.points} for ach in pilot.achievements],
-            'type': 'pilot'
-        }
-        all_members_data.append(member_data)
-    
-    # Получаем последние 20 записей активности
-    activity_logs = AdminActivityLog.query.order_by(AdminActivityLog.timestamp.desc()).limit(20).all()
-    
-    return render_template('admin_dashboard.html', 
-                         participants=all_participants,
-                         pilots=all_pilots_old,  # Для обратной совместимости
-                         all_members=all_members_data,
-                         total_all=total_all,
-                         total_participants=total_participants,
-                         total_pilots_old=total_pilots_old,
-                         active_cards=active_cards,
-                         inactive_cards=inactive_cards,
-                         military_count=military_count,
-                         civil_count=civil_count,
-                         deftech_count=deftech_count,
-                         donor_partner_count=donor_partner_count,
-                         media_education_count=media_education_count,
-                         total_strike_pilots=total_strike_pilots,
-                         total_recon_pilots=total_recon_pilots,
-                         categories=CATEGORIES,
-                         activity_logs=activity_logs)
+class DataVersionCache:
+    """Версия данных (номер, время изменения), известная процессу воркера.
 
-@app.route('/admin/participant/add', methods=['GET', 'POST'])
-@admin_required
-def admin_add_participant():
-    
-    if request.method == 'POST':
-        callsign = request.form['callsign']
-        category = request.form['category']
-        subcategory = request.form['subcategory']
-        photo_url = request.form.get('photo_url', 'default-pilot.svg')
-        custom_id = request.form.get('custom_id', '').strip()
-        
-        # Проверяем кастомный ID или генерируем автоматически
-        if custom_id:
-            # Валидируем формат
-            import re
-            if not re.match(r'^UAV-\d{4}$', custom_id):
-                flash('Неправильний формат ID! Використовуйте формат UAV-XXXX (наприклад, UAV-0012)', 'error')
-                return render_template('admin_add_participant.html', categories=CATEGORIES)
-            
-            # Проверяем уникальность
-            existing_participant = Participant.query.filter_by(participant_id=custom_id).first()
-            existing_pilot = Pilot.query.filter_by(pilot_id=custom_id).first()
-            
-            if existing_participant or existing_pilot:
-                flash(f'ID {custom_id} вже зайнятий! Оберіть інший номер або залишіть поле порожнім для автогенерації.', 'error')
-                return render_template('admin_add_participant.html', categories=CATEGORIES)
-            
-            participant_id = custom_id
-        else:
-            # Автогенерация ID
-            participant_id = generate_next_participant_id()
-        
-        # Генерируем уникальный QR код
-        qr_code = str(uuid.uuid4())
-        
-        participant = Participant(
-            participant_id=participant_id,
-            callsign=callsign,
-            category=category,
-            subcategory=subcategory,
-            photo_url=photo_url,
-            qr_code=qr_code
-        )
-        
-        try:
-            db.session.add(participant)
-            db.session.commit()
-            
-            # Сохраняем QR код в файл
-            save_participant_qr_code(participant)
-            
-            # Логируем активность
-            category_info = CATEGORIES.get(category, {})
-            subcategory_name = category_info.get('subcategories', {}).get(subcategory, subcategory)
-            
-            id_method = "вручну" if custom_id else "автоматично"
-            log_admin_activity(
-                action_type='add_participant',
-                participant=participant,
-                description=f'Додано нового учасника {callsign} ({participant_id}, ID призначено {id_method}) в категорії {category_info.get("name", category)} - {subcategory_name}'
-            )
-            
-            flash(f'Учасник {callsign} (ID: {participant_id}) успішно додано')
-            return redirect(url_for('admin_dashboard'))
-            
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Помилка при додаванні учасника: {str(e)}', 'error')
-            return render_template('admin_add_participant.html', categories=CATEGORIES)
-    
-    return render_template('admin_add_participant.html', categories=CATEGORIES)
+    Сверяется с БД не чаще раза в DATA_VERSION_CHECK_INTERVAL секунд, чтобы подхватить
+    изменения других воркеров; после собственного commit с изменениями сбрасывается сразу.
+    Версии основной БД и реплики хранятся раздельно: ETag и кэш рейтинга должны соответствовать
+    данным той базы, из которой читает текущий запрос.
+    """
 
-@app.route('/admin/check_participant_id')
-@admin_required
-def check_participant_id():
-    """AJAX эндпоинт для проверки доступности ID участника"""
-    participant_id = request.args.get('id', '').strip()
-    
-    if not participant_id:
-        return jsonify({'available': True, 'message': ''})
-    
-    # Валидируем формат
-    import re
-    if not re.match(r'^UAV-\d{4}$', participant_id):
-        return jsonify({'available': False, 'message': 'Неправильний формат! Використовуйте формат UAV-XXXX'})
-    
-    # Проверяем уникальность
-    existing_participant = Participant.query.filter_by(participant_id=participant_id).first()
-    existing_pilot = Pilot.query.filter_by(pilot_id=participant_id).first()
-    
-    if existing_participant or existing_pilot:
-        owner_name = existing_participant.callsign if existing_participant else existing_pilot.callsign
-        return jsonify({'available': False, 'message': f'ID {participant_id} вже зайнятий учасником "{owner_name}"'})
-    
-    return jsonify({'available': True, 'message': f'ID {participant_id} доступний'})
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
 
-@app.route('/admin/participant/<int:participant_id>/edit', methods=['GET', 'POST'])
-@admin_required
-def admin_edit_participant(participant_id):
-    
-    participant = Participant.query.get_or_404(participant_id)
-    
-    if request.method == 'POST':
-        old_callsign = participant.callsign
+    def invalidate(self):
+        with self._lock:
+            self._values.clear()
+
+    def get(self):
+        bind = current_read_bind()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(bind)
+            if cached is not None and now - cached[1] < app.config['DATA_VERSION_CHECK_INTERVAL']:
+                return cached[0]
+
+        row = db.session.execute(
+            db.select(DataVersion.version, DataVersion.updated_at).where(DataVersion.id == 1)
+        ).first()
+        value = (row.version, row.updated_at) if row else (0, None)
+        with self._lock:
+            self._values[bind] = (value, now)
+        return value
+
+data_version_cache = DataVersionCache()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('data_changed', False):
+        data_version_cache.invalidate()
+        leaderboard_cache.invalidate()
+        dashboard_stats_cache.invalidate()
+        if has_request_context():
+            # Read-your-writes: автор изменения какое-то время читает из основной БД (см. _stick_to_primary)
+            g.data_written_at = time.time()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changes_after_rollback(session):
+    session.info.pop('data_changed', None)
+
+# Чтение с реплики: публичные GET-страницы читают из DATABASE_REPLICA_URL, если она настроена и не отстает
+def current_read_bind():
+    """Bind, из которого читает текущий запрос: REPLICA_BIND или None (основная БД)"""
+    return g.get('read_bind') if has_request_context() else None
+
+class ReplicaLagMonitor:
+    """Проверяет, что реплика отстает от основной БД не больше чем на REPLICA_LAG_TOLERANCE секунд.
+
+    Отставание оценивается по строке DataVersion: реплика считается отставшей, если ее версия меньше
+    версии основной БД, а изменение в основной БД старше допустимого отставания. Проверка выполняется
+    не чаще раза в DATA_VERSION_CHECK_INTERVAL секунд; ошибка соединения с репликой тоже выключает ее.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._healthy = True
+        self._checked_at = None
+
+    def _read_version(self, engine):
+        with engine.connect() as connection:
+            row = connection.execute(
+                db.select(DataVersion.version, DataVersion.updated_at).where(DataVersion.id == 1)
+            ).first()
+        return (row.version, row.updated_at) if row else (0, None)
+
+    def check(self):
+        replica_version, _ = self._read_version(db.engines[REPLICA_BIND])
+        primary_version, primary_updated_at = self._read_version(db.engines[None])
+        if replica_version >= primary_version or primary_updated_at is None:
+            return True
+        return datetime.now() - primary_updated_at <= timedelta(seconds=app.config['REPLICA_LAG_TOLERANCE'])
+
+    def is_healthy(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < app.config['DATA_VERSION_CHECK_INTERVAL']:
+                return self._healthy
+            # Остальные потоки до конца проверки пользуются прежним результатом
+            self._checked_at = now
+
+        try:
+            healthy = self.check()
+        except SQLAlchemyError as e:
+            app.logger.warning(f"Реплика недоступна, чтение идет из основной БД: {e}")
+            healthy = False
+        with self._lock:
+            if self._healthy and not healthy:
+                app.logger.warning("Реплика отстает больше допустимого, чтение идет из основной БД")
+            self._healthy = healthy
+        return healthy
+
+replica_lag_monitor = ReplicaLagMonitor()
+
+def read_from_replica(view):
+    """Декоратор публичных страниц: GET-запросы читают из реплики.
+
+    Основная БД используется, если реплика не настроена или отстает, а также в течение
+    REPLICA_LAG_TOLERANCE секунд после изменения данных в этой сессии браузера (read-your-writes).
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if (request.method == 'GET' and app.config['DATABASE_REPLICA_URL']
+                and session.get('primary_reads_until', 0) <= time.time()
+                and replica_lag_monitor.is_healthy()):
+            g.read_bind = REPLICA_BIND
+        return view(*args, **kwargs)
+    return decorated_function
+
+@app.after_request
+def _stick_to_primary(response):
+    written_at = g.get('data_written_at')
+    if written_at is not None and app.config['DATABASE_REPLICA_URL']:
+        session['primary_reads_until'] = written_at + app.config['REPLICA_LAG_TOLERANCE']
+    return response
+
+# Единая модель чтения участников: новые участники и еще не мигрированные старые пилоты
+# Старые пилоты в новой системе - военные пилоты; подкатегория выводится из их старой категории
+LEGACY_PILOT_CATEGORY = 'military'
+
+def legacy_pilot_subcategory():
+    """Подкатегория старого пилота: strike -> pilot_strike, reconnaissance -> pilot_reconnaissance"""
+    return db.case((Pilot.category == 'strike', 'pilot_strike'),
+                   (Pilot.category == 'reconnaissance', 'pilot_reconnaissance'),
+                   else_=Pilot.category)
+
+def build_member_branches():
+    """SELECT участников и SELECT старых пилотов, приведенные к одной форме (ветви member_table).
+
+    Старые пилоты становятся военными пилотами (pilot_strike / pilot_reconnaissance);
+    пилоты, уже мигрированные в участники (тот же qr_code), исключаются прямо в SQL.
+    """
+    participants = db.select(
+        db.literal('participant').label('kind'),
+        Participant.id.label('id'),
+        Participant.participant_id.label('member_id'),
+        Participant.callsign.label('callsign'),
+        Participant.photo_url.label('photo_url'),
+        Participant.category.label('category'),
+        Participant.subcategory.label('subcategory'),
+        Participant.join_date.label('join_date'),
+        db.func.coalesce(Participant.points, db.literal_column('0')).label('points'),
+        Participant.qr_code.label('qr_code'),
+        Participant.is_active.label('is_active')
+    )
+    pilots = db.select(
+        db.literal('pilot').label('kind'),
+        Pilot.id.label('id'),
+        Pilot.pilot_id.label('member_id'),
+        Pilot.callsign.label('callsign'),
+        Pilot.photo_url.label('photo_url'),
+        db.literal(LEGACY_PILOT_CATEGORY).label('category'),
+        legacy_pilot_subcategory().label('subcategory'),
+        Pilot.join_date.label('join_date'),
+        db.func.coalesce(Pilot.points, db.literal_column('0')).label('points'),
+        Pilot.qr_code.label('qr_code'),
+        db.true().label('is_active')
+    ).where(~db.select(Participant.id).where(Participant.qr_code == Pilot.qr_code).exists())
+    return {'participant': participants, 'pilot': pilots}
+
+def build_member_query():
+    """Подзапрос UNION ALL по обеим ветвям build_member_branches()"""
+    return db.union_all(*member_branches.values()).subquery('member')
+
+member_branches = build_member_branches()
+member_table = build_member_query()
+
+# Порядок списков участников: по очкам, затем стабильно по типу и id
+MEMBER_LIST_ORDER = (member_table.c.points.desc(), member_table.c.kind, member_table.c.id)
+
+class Member:
+    """Участник в единой форме (строка member_table), не привязан к сессии БД.
+
+    kind - 'participant' или 'pilot', id - первичный ключ в соответствующей таблице,
+    member_id - ID вида UAV-0001.
+    """
+
+    __slots__ = ('kind', 'id', 'member_id', 'callsign', 'photo_url', 'category', 'subcategory',
+                 'join_date', 'points', 'qr_code', 'is_active')
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, getattr(row, name))
+
+    def __repr__(self):
+        return f'<Member {self.kind} {self.callsign}>'
+
+    @property
+    def key(self):
+        """Ключ (kind, id) для словарей вроде count_achievements()"""
+        return (self.kind, self.id)
+
+    def get_category_info(self):
+        """Возвращает информацию о категории"""
+        return CATEGORIES.get(self.category, {})
+
+    def get_subcategory_name(self):
+        """Возвращает название подкатегории"""
+        return self.get_category_info().get('subcategories', {}).get(self.subcategory, self.subcategory)
+
+    def is_pilot(self):
+        """Проверяет, является ли участник пилотом (для системы очков и публичного рейтинга)"""
+        return is_pilot_subcategory(self.category, self.subcategory)
+
+def fetch_members(statement):
+    """Выполняет SELECT по member_table и возвращает список Member"""
+    return [Member(row) for row in db.session.execute(statement)]
+
+def get_member_by_qr_code(qr_code):
+    """Участник или немигрированный пилот по qr_code (None, если не найден)"""
+    members = fetch_members(db.select(member_table).where(member_table.c.qr_code == qr_code).limit(1))
+    return members[0] if members else None
+
+def get_member_by_member_id(member_id):
+    """Участник или немигрированный пилот по ID вида UAV-0001 (None, если не найден)"""
+    members = fetch_members(db.select(member_table).where(member_table.c.member_id == member_id).limit(1))
+    return members[0] if members else None
+
+def encode_member_cursor(member):
+    """Курсор списка участников - (очки, тип, id) последней показанной записи"""
+    return f"{member.points}_{member.kind}_{member.id}"
+
+def decode_member_cursor(value):
+    """Разбирает курсор списка; возвращает (очки, тип, id) или None для некорректного значения"""
+    try:
+        points, kind, member_pk = value.split('_')
+        if kind not in member_branches:
+            return None
+        return int(points), kind, int(member_pk)
+    except (AttributeError, ValueError):
+        return None
+
+def fetch_member_page(category=None, after=None, limit=20):
+    """Страница списка участников в порядке MEMBER_LIST_ORDER после курсора after (keyset, без OFFSET и COUNT).
+
+    Каждая ветвь (участники, старые пилоты) читается отдельно по индексу (очки, id) с LIMIT,
+    результаты сливаются в Python - стоимость страницы не зависит от числа участников.
+    """
+    pages = []
+    for kind, branch in member_branches.items():
+        columns = branch.selected_columns
+        statement = branch
+        if category:
+            statement = statement.where(columns.category == category)
+        if after is not None:
+            points, after_kind, after_id = after
+            # Порядок: очки по убыванию, затем тип и id по возрастанию; тип ветви - константа
+            if kind > after_kind:
+                statement = statement.where(columns.points <= points)
+            elif kind == after_kind:
+                statement = statement.where(db.or_(columns.points < points,
+                                                   db.and_(columns.points == points, columns.id > after_id)))
+            else:
+                statement = statement.where(columns.points < points)
+        pages.extend(fetch_members(statement.order_by(columns.points.desc(), columns.id).limit(limit)))
+    pages.sort(key=lambda member: (-member.points, member.kind, member.id))
+    return pages[:limit]
+
+# Подкатегории, попадающие в публичный рейтинг; гражданские пилоты считаются ударными
+RATING_CATEGORIES = {
+    ('military', 'pilot_strike'): 'strike',
+    ('military', 'pilot_reconnaissance'): 'recon',
+    ('civil', 'pilot'): 'strike',
+}
+
+def competition_ranks(members):
+    """Места для списка, отсортированного по убыванию очков: равные очки делят место (1, 2, 2, 4),
+    как в get_category_rank"""
+    ranks = []
+    for index, member in enumerate(members):
+        if index and (member.points or 0) == (members[index - 1].points or 0):
+            ranks.append(ranks[-1])
+        else:
+            ranks.append(index + 1)
+    return tuple(ranks)
+
+def build_leaderboard():
+    """Собирает списки рейтинга из БД (ударные, розвідувальні и общий) одним запросом"""
+    all_pilots = fetch_members(
+        db.select(member_table)
+        .where(db.or_(*(db.and_(member_table.c.category == category, member_table.c.subcategory == subcategory)
+                        for category, subcategory in RATING_CATEGORIES)))
+        .order_by(*MEMBER_LIST_ORDER)
+    )
+    strike_pilots = [m for m in all_pilots if get_rating_category(m) == 'strike']
+    recon_pilots = [m for m in all_pilots if get_rating_category(m) == 'recon']
+
+    return {
+        'all_pilots': tuple(all_pilots),
+        'strike_pilots': tuple(strike_pilots),
+        'recon_pilots': tuple(recon_pilots),
+        'all_ranks': competition_ranks(all_pilots),
+        'strike_ranks': competition_ranks(strike_pilots),
+        'recon_ranks': competition_ranks(recon_pilots),
+        # Очки по возрастанию - для поиска места в категории бинарным поиском
+        'strike_points': tuple(sorted(p.points for p in strike_pilots)),
+        'recon_points': tuple(sorted(p.points for p in recon_pilots)),
+    }
+
+class LeaderboardCache:
+    """Кэш готового рейтинга внутри процесса воркера.
+
+    Рейтинг пересобирается только при смене версии данных (см. DataVersionCache),
+    поэтому, пока данные не менялись, запрос к рейтингу не обращается к БД вовсе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self._version = None
+
+    def get(self):
+        version = get_data_version()
+        with self._lock:
+            if self._data is not None and self._version == version:
+                return self._data
+
+        data = build_leaderboard()
+        with self._lock:
+            self._data = data
+            self._version = version
+        return data
+
+leaderboard_cache = LeaderboardCache()
+
+def get_rating_category(member):
+    """Возвращает категорию рейтинга участника: 'strike', 'recon' или None"""
+    return RATING_CATEGORIES.get((member.category, member.subcategory))
+
+def get_category_rank(member):
+    """Место участника в его категории рейтинга за O(log n) (None, если он не в рейтинге).
+
+    Участники с одинаковыми очками делят одно место.
+    """
+    rating_category = get_rating_category(member)
+    if rating_category is None:
+        return None
+    points = leaderboard_cache.get()[f'{rating_category}_points']
+    higher = len(points) - bisect.bisect_right(points, member.points or 0)
+    return higher + 1
+
+class TimedCache:
+    """Кэш одного значения внутри процесса воркера с ограниченным временем жизни"""
+
+    def __init__(self, ttl_config_key):
+        self._ttl_config_key = ttl_config_key
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._expires_at = 0.0
+
+    def get(self, loader):
+        now = time.monotonic()
+        with self._lock:
+            if self._value is not None and now < self._expires_at:
+                return self._value
+
+        value = loader()
+        with self._lock:
+            self._value = value
+            self._expires_at = now + app.config[self._ttl_config_key]
+        return value
+
+class LRUCache:
+    """Ограниченный по количеству элементов LRU-кэш внутри процесса воркера"""
+
+    def __init__(self, size_config_key):
+        self._size_config_key = size_config_key
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > app.config[self._size_config_key]:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+def collect_member_stats():
+    """Собирает статистику админ-панели одним GROUP BY-запросом по member_table.
+
+    Пилоты, уже мигрированные в участники, считаются один раз - как участники: total_unmigrated_pilots
+    включает только старых пилотов без пары, а total_all равен числу профилей в списке.
+    """
+    stats = {
+        'total_participants': 0,
+        'total_unmigrated_pilots': 0,
+        'active_cards': 0,
+        'inactive_cards': 0,
+        'total_strike_pilots': 0,
+        'total_recon_pilots': 0,
+    }
+    for cat_key in CATEGORIES:
+        stats[f'{cat_key}_count'] = 0
+
+    rows = db.session.execute(
+        db.select(member_table.c.kind, member_table.c.category, member_table.c.subcategory,
+                  member_table.c.is_active, db.func.count())
+        .group_by(member_table.c.kind, member_table.c.category, member_table.c.subcategory,
+                  member_table.c.is_active)
+    ).all()
+    for kind, category, subcategory, is_active, count in rows:
+        if kind == 'pilot':
+            # Старые (немигрированные) пилоты: без ID-карт и вне счетчиков категорий
+            stats['total_unmigrated_pilots'] += count
+        else:
+            stats['total_participants'] += count
+            if is_active is True:
+                stats['active_cards'] += count
+            elif is_active is False:
+                stats['inactive_cards'] += count
+            if category in CATEGORIES:
+                stats[f'{category}_count'] += count
+        if category == 'military' and subcategory == 'pilot_strike':
+            stats['total_strike_pilots'] += count
+        elif category == 'military' and subcategory == 'pilot_reconnaissance':
+            stats['total_recon_pilots'] += count
+
+    stats['total_all'] = stats['total_participants'] + stats['total_unmigrated_pilots']
+    return stats
+
+dashboard_stats_cache = TimedCache('DASHBOARD_STATS_TTL')
+
+def count_achievements(members):
+    """Количество достижений для списка Member одним GROUP BY-запросом.
+
+    Возвращает словарь {('participant' | 'pilot', id): количество}.
+    """
+    participant_ids = [m.id for m in members if m.kind == 'participant']
+    pilot_ids = [m.id for m in members if m.kind == 'pilot']
+    if not participant_ids and not pilot_ids:
+        return {}
+    
+    kind = db.case((Achievement.participant_id.isnot(None), 'participant'), else_='pilot')
+    owner_id = db.func.coalesce(Achievement.participant_id, Achievement.pilot_id)
+    rows = db.session.execute(
+        db.select(kind, owner_id, db.func.count())
+        .where(db.or_(Achievement.participant_id.in_(participant_ids), Achievement.pilot_id.in_(pilot_ids)))
+        .group_by(kind, owner_id)
+    ).all()
+    return {(row_kind, row_owner): count for row_kind, row_owner, count in rows}
+
+def serialize_member(member, achievement_counts):
+    """Преобразует Member в словарь для JSON-ответов админ-панели"""
+    category_info = member.get_category_info()
+    editable = member.kind == 'participant'
+    return {
+        'type': member.kind,
+        'member_id': member.member_id,
+        'category': member.category,
+        'subcategory': member.subcategory,
+        'subcategory_name': member.get_subcategory_name(),
+        'is_pilot': member.is_pilot(),
+        # Старых пилотов редактировать нельзя
+        'edit_url': url_for('admin_edit_participant', participant_id=member.id) if editable else None,
+        'delete_url': url_for('admin_delete_participant', participant_id=member.id) if editable else None,
+        'achievement_url': url_for('admin_add_participant_achievement', participant_id=member.id) if editable else None,
+        'id': member.id,
+        'callsign': member.callsign,
+        'category_name': category_info.get('name', member.category),
+        'category_emoji': category_info.get('emoji', ''),
+        'points': member.points,
+        'photo_url': member.photo_url,
+        'photo_src': photo_src(member.photo_url),
+        'photo_srcset': photo_srcset(member.photo_url),
+        'join_date': member.join_date.strftime('%d.%m.%Y') if member.join_date else '',
+        'qr_code_short': (member.qr_code or '')[:8],
+        'achievements_count': achievement_counts.get(member.key, 0),
+        'profile_url': url_for('pilot_profile', qr_code=member.qr_code) if member.qr_code else None
+    }
+
+# Поиск участников в админ-панели: FTS5 с триграммами (SQLite) или pg_trgm (PostgreSQL)
+SEARCH_MIN_TRIGRAM_LENGTH = 3
+
+_search_backend = None
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # Встроенные lower()/LIKE в SQLite понимают регистр только для латиницы
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('casefold', 1, lambda value: value.casefold() if value else value,
+                                         deterministic=True)
+
+SEARCH_INDEX_TRIGGERS = (
+    'member_search_participant_ai', 'member_search_participant_ad', 'member_search_participant_au',
+    'member_search_pilot_ai', 'member_search_pilot_ad', 'member_search_pilot_au',
+)
+
+# Коды ошибок PostgreSQL, означающие, что расширение нельзя установить: нет прав, нет пакета
+PG_EXTENSION_UNAVAILABLE_SQLSTATES = {'42501', '0A000', '58P01'}
+
+def sqlite_supports_trigram_index():
+    """FTS5 с токенизатором trigram: SQLite 3.34+, собранный с FTS5"""
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    return bool(db.session.execute(db.text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+def ensure_search_index():
+    """Создает поисковый индекс участников, если его еще нет (шаг миграции 4).
+
+    Если база не умеет строить индекс (нет прав на pg_trgm, SQLite без FTS5 с токенизатором trigram),
+    шаг завершается с предупреждением и поиск работает перебором (get_search_backend вернет 'scan'
+    для SQLite, в PostgreSQL тот же ILIKE без индекса). Остальные ошибки DDL пробрасываются, чтобы шаг
+    не был отмечен примененным и повторился при следующем запуске.
+    """
+    global _search_backend
+    dialect = db.engine.dialect.name
+    
+    if dialect == 'postgresql':
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except SQLAlchemyError as e:
+            orig = getattr(e, 'orig', None)
+            sqlstate = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)  # psycopg2 / psycopg 3
+            if sqlstate not in PG_EXTENSION_UNAVAILABLE_SQLSTATES:
+                raise
+            app.logger.warning(f"Расширение pg_trgm недоступно ({e.__class__.__name__}): "
+                               f"поиск участников будет работать без индекса")
+            return
+        for table, column in (('participant', 'participant_id'), ('participant', 'callsign'),
+                              ('pilot', 'pilot_id'), ('pilot', 'callsign')):
+            db.session.execute(db.text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm "
+                f"ON {table} USING gin ({column} gin_trgm_ops)"))
+        _search_backend = None
+        print("Триграммные индексы поиска готовы")
+        return
+    
+    if dialect != 'sqlite':
+        return
+    
+    if not sqlite_supports_trigram_index():
+        _search_backend = 'scan'
+        app.logger.warning(f"SQLite {sqlite3.sqlite_version} без FTS5 с токенизатором trigram (нужна 3.34+): "
+                           f"поиск участников будет работать перебором")
+        return
+    
+    objects = ('member_search',) + SEARCH_INDEX_TRIGGERS
+    existing = set(db.session.execute(
+        db.text("SELECT name FROM sqlite_master WHERE name IN :names").bindparams(db.bindparam('names', expanding=True)),
+        {'names': list(objects)}).scalars())
+    if existing == set(objects):
+        return
+    # DDL в SQLite выполняется вне транзакции - остатки прерванной попытки удаляем и строим индекс заново
+    for trigger in SEARCH_INDEX_TRIGGERS:
+        db.session.execute(db.text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    db.session.execute(db.text("DROP TABLE IF EXISTS member_search"))
+    
+    # rowid: id * 2 для участников и id * 2 + 1 для старых пилотов
+    statements = [
+        """CREATE VIRTUAL TABLE member_search USING fts5(
+            kind UNINDEXED, member_pk UNINDEXED,
+            member_id, callsign, category, subcategory,
+            tokenize = 'trigram'
+        )""",
+        """INSERT INTO member_search(rowid, kind, member_pk, member_id, callsign, category, subcategory)
+           SELECT id * 2, 'participant', id, participant_id, callsign, category, subcategory FROM participant""",
+        """INSERT INTO member_search(rowid, kind, member_pk, member_id, callsign, category, subcategory)
+           SELECT id * 2 + 1, 'pilot', id, pilot_id, callsign, 'military',
+                  CASE WHEN category = 'strike' THEN 'pilot_strike' ELSE 'pilot_reconnaissance' END
+           FROM pilot""",
+        """CREATE TRIGGER member_search_participant_ai AFTER INSERT ON participant BEGIN
+             INSERT INTO member_search(rowid, kind, member_pk, member_id, callsign, category, subcategory)
+             VALUES (new.id * 2, 'participant', new.id, new.participant_id, new.callsign, new.category, new.subcategory);
+           END""",
+        """CREATE TRIGGER member_search_participant_ad AFTER DELETE ON participant BEGIN
+             DELETE FROM member_search WHERE rowid = old.id * 2;
+           END""",
+        """CREATE TRIGGER member_search_participant_au
+           AFTER UPDATE OF participant_id, callsign, category, subcategory ON participant BEGIN
+             DELETE FROM member_search WHERE rowid = old.id * 2;
+             INSERT INTO member_search(rowid, kind, member_pk, member_id, callsign, category, subcategory)
+             VALUES (new.id * 2, 'participant', new.id, new.participant_id, new.callsign, new.category, new.subcategory);
+           END""",
+        """CREATE TRIGGER member_search_pilot_ai AFTER INSERT ON pilot BEGIN
+             INSERT INTO member_search(rowid, kind, member_pk, member_id, callsign, category, subcategory)
+             VALUES (new.id * 2 + 1, 'pilot', new.id, new.pilot_id, new.callsign, 'military',
+                     CASE WHEN new.category = 'strike' THEN 'pilot_strike' ELSE 'pilot_reconnaissance' END);
+           END""",
+        """CREATE TRIGGER member_search_pilot_ad AFTER DELETE ON pilot BEGIN
+             DELETE FROM member_search WHERE rowid = old.id * 2 + 1;
+           END""",
+        """CREATE TRIGGER member_search_pilot_au AFTER UPDATE OF pilot_id, callsign, category ON pilot BEGIN
+             DELETE FROM member_search WHERE rowid = old.id * 2 + 1;
+             INSERT INTO member_search(rowid, kind, member_pk, member_id, callsign, category, subcategory)
+             VALUES (new.id * 2 + 1, 'pilot', new.id, new.pilot_id, new.callsign, 'military',
+                     CASE WHEN new.category = 'strike' THEN 'pilot_strike' ELSE 'pilot_reconnaissance' END);
+           END""",
+    ]
+    for statement in statements:
+        db.session.execute(db.text(statement))
+    _search_backend = None
+    print("Поисковый индекс member_search создан")
+
+def get_search_backend():
+    """Определяет один раз на процесс: 'fts5' (SQLite с индексом), 'postgresql' или 'scan'"""
+    global _search_backend
+    if _search_backend is None:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            _search_backend = 'postgresql'
+        elif dialect == 'sqlite' and db.session.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'member_search'")).first():
+            _search_backend = 'fts5'
+        else:
+            _search_backend = 'scan'
+    return _search_backend
+
+def _matching_category_keys(query, prefix_only=False):
+    """Ключи категорий и подкатегорий, содержащие запрос (или начинающиеся с него)"""
+    def matches(key):
+        return key.startswith(query) if prefix_only else query in key
+    categories = {key for key in CATEGORIES if matches(key)}
+    subcategories = {sub_key for cat in CATEGORIES.values() for sub_key in cat['subcategories'] if matches(sub_key)}
+    # Пустой IN () недопустим - подставляем заведомо несуществующее значение
+    return sorted(categories) or [''], sorted(subcategories) or ['']
+
+def _postgresql_search_sql(folded, category, params):
+    """SQL поиска для PostgreSQL; заполняет params.
+
+    Условия накладываются на исходные колонки каждой таблицы, а не на UNION: ILIKE по ID и позывному
+    идет через триграммные GIN-индексы, совпадение категории - через равенства по ведущим колонкам
+    индексов (category, subcategory, points) и (category, points). Так планировщик объединяет их
+    в BitmapOr вместо полного просмотра таблиц.
+    """
+    short_query = len(folded) < SEARCH_MIN_TRIGRAM_LENGTH
+    categories, subcategories = _matching_category_keys(folded, prefix_only=short_query)
+    params['pattern'] = '%' + folded.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    
+    # Подкатегория однозначна только вместе с категорией - раскрываем ее в пары (category, subcategory)
+    participant_match = []
+    for index, key in enumerate(key for key in categories if key in CATEGORIES):
+        params[f'match_category_{index}'] = key
+        participant_match.append(f"category = :match_category_{index}")
+    pairs = [(category_key, sub_key) for category_key, info in CATEGORIES.items() if category_key not in categories
+             for sub_key in info['subcategories'] if sub_key in subcategories]
+    for index, (category_key, sub_key) in enumerate(pairs):
+        params[f'match_pair_category_{index}'], params[f'match_pair_subcategory_{index}'] = category_key, sub_key
+        participant_match.append(
+            f"(category = :match_pair_category_{index} AND subcategory = :match_pair_subcategory_{index})")
+    
+    # Старые пилоты - военные; их подкатегория задается колонкой category ('strike' / 'reconnaissance')
+    if 'military' in categories:
+        pilot_match = ['TRUE']
+    else:
+        pilot_match = [f"category = '{legacy}'" for legacy, sub_key in (('strike', 'pilot_strike'),
+                                                                         ('reconnaissance', 'pilot_reconnaissance'))
+                       if sub_key in subcategories]
+    
+    def branch(kind, table, id_column, category_match, extra_filter):
+        category_match = ' OR '.join(category_match) or 'FALSE'
+        return f"""
+                SELECT '{kind}' AS kind, id AS member_pk,
+                       CASE
+                           WHEN lower({id_column}) = :q OR lower(callsign) = :q THEN 0
+                           WHEN strpos(lower({id_column}), :q) = 1 OR strpos(lower(callsign), :q) = 1 THEN 1
+                           WHEN {category_match} THEN 2
+                           ELSE 3
+                       END AS score,
+                       points
+                FROM {table}
+                WHERE ({id_column} ILIKE :pattern OR callsign ILIKE :pattern OR {category_match})
+                      {extra_filter}"""
+    
+    branches = [branch('participant', 'participant', 'participant_id', participant_match,
+                       "AND category = :category" if category else "")]
+    if not category or category == 'military':
+        branches.append(branch('pilot', 'pilot', 'pilot_id', pilot_match,
+                               "AND NOT EXISTS (SELECT 1 FROM participant AS migrated "
+                               "WHERE migrated.qr_code = pilot.qr_code)"))
+    return f"""
+            SELECT m.kind, m.member_pk, m.score, m.points
+            FROM ({' UNION ALL '.join(branches)}
+            ) AS m
+            ORDER BY m.score, m.points DESC, m.kind, m.member_pk
+            LIMIT :limit OFFSET :offset
+        """
+
+def search_members(query, category=None, limit=20, offset=0):
+    """Ищет участников и старых пилотов по ID, позывному, категории и подкатегории.
+
+    Возвращает список (kind, id) в порядке релевантности: точное совпадение ID или
+    позывного, затем совпадение по началу, затем по категории и, наконец, по подстроке.
+    Внутри одной группы - по убыванию очков.
+
+    Старые пилоты, уже мигрированные в участники (тот же qr_code), исключаются в SQL -
+    как в build_member_query, - чтобы LIMIT/OFFSET считались по уникальным участникам.
+    """
+    folded = query.casefold()
+    backend = get_search_backend()
+    params = {'q': folded, 'limit': limit, 'offset': offset, 'category': category}
+    category_filter = "AND m.category = :category" if category else ""
+    
+    if backend == 'fts5' and len(folded) >= SEARCH_MIN_TRIGRAM_LENGTH:
+        # Подстрока ищется по триграммному индексу, ранжируются только найденные строки
+        params['match'] = '"' + query.replace('"', '""') + '"'
+        sql = f"""
+            SELECT m.kind, m.member_pk,
+                   CASE
+                       WHEN casefold(m.member_id) = :q OR casefold(m.callsign) = :q THEN 0
+                       WHEN instr(casefold(m.member_id), :q) = 1 OR instr(casefold(m.callsign), :q) = 1 THEN 1
+                       WHEN instr(m.category, :q) = 1 OR instr(m.subcategory, :q) = 1 THEN 2
+                       ELSE 3
+                   END AS score,
+                   COALESCE(p.points, pl.points, 0) AS points
+            FROM member_search AS m
+            LEFT JOIN participant AS p ON m.kind = 'participant' AND p.id = m.member_pk
+            LEFT JOIN pilot AS pl ON m.kind = 'pilot' AND pl.id = m.member_pk
+            WHERE member_search MATCH :match {category_filter}
+                  AND (m.kind = 'participant'
+                       OR NOT EXISTS (SELECT 1 FROM participant AS migrated WHERE migrated.qr_code = pl.qr_code))
+            ORDER BY score, points DESC, m.rowid
+            LIMIT :limit OFFSET :offset
+        """
+    elif backend == 'postgresql':
+        sql = _postgresql_search_sql(folded, category, params)
+    else:
+        short_query = len(folded) < SEARCH_MIN_TRIGRAM_LENGTH
+        categories, subcategories = _matching_category_keys(folded, prefix_only=short_query)
+        params.update({'categories': categories, 'subcategories': subcategories})
+        fold, position = 'casefold', 'instr'
+        # Короткие запросы (меньше трех символов) ищутся только по началу ID и позывного
+        if short_query:
+            text_match = "instr(casefold(m.member_id), :q) = 1 OR instr(casefold(m.callsign), :q) = 1"
+        else:
+            text_match = "instr(casefold(m.member_id), :q) > 0 OR instr(casefold(m.callsign), :q) > 0"
+        sql = f"""
+            SELECT m.kind, m.member_pk,
+                   CASE
+                       WHEN {fold}(m.member_id) = :q OR {fold}(m.callsign) = :q THEN 0
+                       WHEN {position}({fold}(m.member_id), :q) = 1 OR {position}({fold}(m.callsign), :q) = 1 THEN 1
+                       WHEN m.category IN :categories OR m.subcategory IN :subcategories THEN 2
+                       ELSE 3
+                   END AS score,
+                   m.points
+            FROM (
+                SELECT 'participant' AS kind, id AS member_pk, participant_id AS member_id, callsign,
+                       category, subcategory, points
+                FROM participant
+                UNION ALL
+                SELECT 'pilot', id, pilot_id, callsign, 'military',
+                       CASE WHEN category = 'strike' THEN 'pilot_strike' ELSE 'pilot_reconnaissance' END,
+                       points
+                FROM pilot
+                WHERE NOT EXISTS (SELECT 1 FROM participant AS migrated WHERE migrated.qr_code = pilot.qr_code)
+            ) AS m
+            WHERE ({text_match} OR m.category IN :categories OR m.subcategory IN :subcategories)
+                  {category_filter}
+            ORDER BY score, m.points DESC, m.kind, m.member_pk
+            LIMIT :limit OFFSET :offset
+        """
+    
+    statement = db.text(sql)
+    if 'categories' in params:
+        statement = statement.bindparams(db.bindparam('categories', expanding=True),
+                                         db.bindparam('subcategories', expanding=True))
+    if not category:
+        params.pop('category')
+    rows = db.session.execute(statement, params).all()
+    return [(row.kind, row.member_pk) for row in rows]
+
+def load_members(keys):
+    """Загружает Member по списку (kind, id) одним запросом, сохраняя порядок"""
+    participant_ids = [pk for kind, pk in keys if kind == 'participant']
+    pilot_ids = [pk for kind, pk in keys if kind == 'pilot']
+    if not participant_ids and not pilot_ids:
+        return []
+    loaded = {member.key: member for member in fetch_members(
+        db.select(member_table).where(db.or_(
+            db.and_(member_table.c.kind == 'participant', member_table.c.id.in_(participant_ids)),
+            db.and_(member_table.c.kind == 'pilot', member_table.c.id.in_(pilot_ids))
+        ))
+    )}
+    return [loaded[key] for key in keys if key in loaded]
+
+# Метрики: задержка маршрутов, SQL-запросы, рендеринг шаблонов и QR-кодов в текстовом формате Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# name -> (тип, описание, имена меток, границы гистограммы)
+METRICS = {
+    'http_requests_total': ('counter', 'Количество HTTP-запросов', ('endpoint', 'method', 'status'), None),
+    'http_request_duration_seconds': ('histogram', 'Время обработки HTTP-запроса', ('endpoint', 'method'), LATENCY_BUCKETS),
+    'db_queries_total': ('counter', 'Количество SQL-запросов', ('endpoint',), None),
+    'db_query_duration_seconds_total': ('counter', 'Суммарное время SQL-запросов', ('endpoint',), None),
+    'db_queries_per_request': ('histogram', 'Количество SQL-запросов на один HTTP-запрос', ('endpoint',), QUERY_COUNT_BUCKETS),
+    'template_render_duration_seconds': ('histogram', 'Время рендеринга шаблона', ('template',), LATENCY_BUCKETS),
+    'qr_render_duration_seconds': ('histogram', 'Время генерации PNG QR-кода', (), LATENCY_BUCKETS),
+}
+
+class MetricsRegistry:
+    """Метрики процесса воркера. Снимок периодически пишется в METRICS_DIR, /metrics суммирует снимки всех воркеров."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = 0.0
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        key = (name, tuple(labels))
+        buckets = METRICS[name][3]
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(counts), total, count]
+                               for (name, labels), (counts, total, count) in self._histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Записывает снимок воркера в METRICS_DIR (не чаще METRICS_FLUSH_INTERVAL, если не force)"""
+        directory = app.config['METRICS_DIR']
+        now = time.monotonic()
+        if not directory or (not force and now - self._flushed_at < app.config['METRICS_FLUSH_INTERVAL']):
+            return
+        self._flushed_at = now
+        try:
+            write_file_atomic(self.snapshot_path(os.getpid()), json.dumps(self.snapshot()).encode('utf-8'))
+        except OSError as e:
+            app.logger.warning(f"Не удалось записать снимок метрик: {e}")
+
+    def snapshot_path(self, pid):
+        return os.path.join(app.config['METRICS_DIR'], f"metrics-{pid}.json")
+
+    def clear_snapshots(self):
+        """Удаляет снимки прошлых запусков; вызывается при старте мастер-процесса gunicorn (gunicorn.conf.py)"""
+        directory = app.config['METRICS_DIR']
+        if not directory or not os.path.isdir(directory):
+            return
+        for filename in os.listdir(directory):
+            if filename.startswith('metrics-') and filename.endswith('.json'):
+                self.remove_snapshot(filename[len('metrics-'):-len('.json')])
+
+    def remove_snapshot(self, pid):
+        """Удаляет снимок завершившегося воркера, чтобы его счетчики не суммировались и не достались новому
+        воркеру с тем же pid"""
+        if not app.config['METRICS_DIR']:
+            return
+        try:
+            os.remove(self.snapshot_path(pid))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            app.logger.warning(f"Не удалось удалить снимок метрик воркера {pid}: {e}")
+
+    def collect(self):
+        """Снимки всех работающих воркеров"""
+        directory = app.config['METRICS_DIR']
+        if not directory:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for filename in sorted(os.listdir(directory)):
+            if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+metrics = MetricsRegistry()
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def render_metrics(snapshots):
+    """Суммирует снимки воркеров и форматирует их в текстовом формате Prometheus"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total, count in snapshot.get('histograms', []):
+            key = (name, tuple(labels))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+
+    lines = []
+    for name, (metric_type, description, label_names, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {value}")
+            continue
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(label_names, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(label_names, labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(label_names, labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(label_names, labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+def _metrics_endpoint():
+    """Метка маршрута: имя endpoint, 'unmatched' для 404 без маршрута, 'background' вне запроса"""
+    if not has_request_context():
+        return 'background'
+    return request.endpoint or 'unmatched'
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_started_at = time.perf_counter()
+
+@app.after_request
+def _remember_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def _record_request_metrics(exc):
+    started_at = g.get('metrics_started_at')
+    if started_at is None:
+        return
+    endpoint = _metrics_endpoint()
+    status = g.get('metrics_status', 500)
+    queries, query_time = g.get('metrics_sql', (0, 0.0))
+
+    metrics.inc('http_requests_total', (endpoint, request.method, status))
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - started_at, (endpoint, request.method))
+    metrics.inc('db_queries_total', (endpoint,), queries)
+    metrics.inc('db_query_duration_seconds_total', (endpoint,), query_time)
+    metrics.observe('db_queries_per_request', queries, (endpoint,))
+    metrics.flush()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Время старта хранится в контексте выполнения: он живет ровно один запрос, и у упавшего
+    # запроса (after_cursor_execute не вызывается) ничего не остается в соединении
+    if context is not None:
+        context.query_started_at = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query_metrics(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, 'query_started_at', None)
+    if started_at is None:
+        return
+    elapsed = time.perf_counter() - started_at
+    if has_request_context():
+        queries, query_time = g.get('metrics_sql', (0, 0.0))
+        g.metrics_sql = (queries + 1, query_time + elapsed)
+        if app.config['SQL_PROFILE']:
+            record_profiled_query(statement, elapsed)
+    else:
+        metrics.inc('db_queries_total', ('background',))
+        metrics.inc('db_query_duration_seconds_total', ('background',), elapsed)
+
+@before_render_template.connect_via(app)
+def _start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_started_at', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def _record_template_metrics(sender, template, context, **extra):
+    started = g.get('template_started_at')
+    if started:
+        metrics.observe('template_render_duration_seconds', time.perf_counter() - started.pop(), (template.name,))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        abort(401)
+    return Response(render_metrics(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Профилирование SQL для разработки и CI (SQL_PROFILE): все запросы запроса с местом вызова и поиск N+1
+SQL_SHAPE_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%\(\w+\)s|%s|:\w+|\?'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+)
+SQL_PROFILER_FRAMES = {'_query_call_site', 'record_profiled_query', '_record_query_metrics'}
+_sql_profile_lock = threading.Lock()
+
+def normalize_sql(statement):
+    """Форма запроса без значений: запросы, отличающиеся только параметрами, совпадают"""
+    for pattern, replacement in SQL_SHAPE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+def _query_call_site():
+    """Ближайшая функция app.py в стеке вызова запроса"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == __file__ and code.co_name not in SQL_PROFILER_FRAMES:
+            return f"{code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return None
+
+def record_profiled_query(statement, elapsed):
+    g.setdefault('sql_profile', []).append({
+        'sql': statement,
+        'ms': round(elapsed * 1000, 3),
+        'call_site': _query_call_site(),
+    })
+
+def build_sql_profile(queries):
+    """Сводка по запросам: группы одинаковой формы, повторяющиеся SQL_PROFILE_N_PLUS_ONE_THRESHOLD раз и более"""
+    groups = {}
+    for query in queries:
+        group = groups.setdefault(normalize_sql(query['sql']), {'count': 0, 'ms': 0.0, 'call_sites': set()})
+        group['count'] += 1
+        group['ms'] += query['ms']
+        if query['call_site']:
+            group['call_sites'].add(query['call_site'])
+
+    threshold = app.config['SQL_PROFILE_N_PLUS_ONE_THRESHOLD']
+    suspects = [
+        {'shape': shape, 'count': group['count'], 'ms': round(group['ms'], 3), 'call_sites': sorted(group['call_sites'])}
+        for shape, group in sorted(groups.items(), key=lambda item: -item[1]['count'])
+        if group['count'] >= threshold
+    ]
+    return {
+        'query_count': len(queries),
+        'query_ms': round(sum(query['ms'] for query in queries), 3),
+        'n_plus_one': suspects,
+        'queries': queries,
+    }
+
+@app.after_request
+def _add_sql_profile_headers(response):
+    if not app.config['SQL_PROFILE']:
+        return response
+    queries = g.get('sql_profile', [])
+    query_ms = sum(query['ms'] for query in queries)
+    response.headers['X-Query-Count'] = str(len(queries))
+    timings = [f'db;dur={query_ms:.1f};desc="{len(queries)} queries"']
+    if g.get('metrics_started_at') is not None:
+        timings.append(f"app;dur={(time.perf_counter() - g.metrics_started_at) * 1000:.1f}")
+    response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+@app.teardown_request
+def _report_sql_profile(exc):
+    if not app.config['SQL_PROFILE'] or g.get('metrics_started_at') is None:
+        return
+    profile = build_sql_profile(g.get('sql_profile', []))
+    profile.update({
+        'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': g.get('metrics_status', 500),
+        'duration_ms': round((time.perf_counter() - g.metrics_started_at) * 1000, 3),
+    })
+
+    app.logger.info(f"SQL {profile['method']} {profile['path']}: {profile['query_count']} запросов, {profile['query_ms']:.1f} мс")
+    for suspect in profile['n_plus_one']:
+        call_sites = ', '.join(suspect['call_sites']) or 'место вызова не найдено'
+        app.logger.warning(f"Возможный N+1 в {profile['endpoint']} ({call_sites}): "
+                           f"{suspect['count']} запросов вида {suspect['shape'][:200]}")
+
+    directory = app.config['SQL_PROFILE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        line = json.dumps(profile, ensure_ascii=False, default=str) + '\n'
+        with _sql_profile_lock, open(os.path.join(directory, f"sql-profile-{os.getpid()}.ndjson"), 'a', encoding='utf-8') as f:
+            f.write(line)
+
+# Условные ответы для публичных страниц: ETag и Last-Modified строятся из версии данных
+_templates_fingerprint = None
+
+def templates_fingerprint():
+    """Хэш шаблонов и манифеста статики: после деплоя с измененной разметкой или стилями ETag тоже меняется"""
+    global _templates_fingerprint
+    if _templates_fingerprint is None:
+        digest = hashlib.sha256(json.dumps(asset_manifest, sort_keys=True).encode('utf-8'))
+        for name in sorted(app.jinja_env.list_templates()):
+            digest.update(name.encode('utf-8'))
+            digest.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode('utf-8'))
+        _templates_fingerprint = digest.hexdigest()[:16]
+    return _templates_fingerprint
+
+def data_version_etag(*parts):
+    """Сильный ETag страницы: версия данных, шаблоны и параметры страницы"""
+    version, _ = data_version_cache.get()
+    raw = ':'.join(str(part) for part in (version, templates_fingerprint()) + parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def conditional_page(etag, render, last_modified=None):
+    """Отдает 304 без рендеринга, если у клиента актуальная копия, иначе - render().
+
+    Страницы с непоказанными flash-сообщениями зависят от сессии и не кэшируются.
+    """
+    if session.get('_flashes'):
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+    
+    if last_modified is not None:
+        # Время версии хранится в локальном времени; HTTP-даты - с точностью до секунды
+        last_modified = last_modified.replace(microsecond=0).astimezone(timezone.utc)
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (last_modified is not None and request.if_modified_since is not None
+                        and last_modified <= request.if_modified_since)
+    
+    response = make_response('' if not_modified else render())
+    if not_modified:
+        response.status_code = 304
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = (f"public, max-age={app.config['PAGE_CACHE_MAX_AGE']}, "
+                                         f"stale-while-revalidate={app.config['PAGE_STALE_WHILE_REVALIDATE']}")
+    return response
+
+# Кэш отрендеренных страниц без данных запроса: память воркера, затем (если задан каталог) диск
+class FilePageCache:
+    """Файловый уровень кэша страниц, общий для всех воркеров на сервере"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.html')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, value):
+        try:
+            write_file_atomic(self._path(key), value)
+        except OSError as e:
+            app.logger.warning(f"Не удалось записать страницу в файловый кэш: {e}")
+
+class RenderedPageCache:
+    """Многоуровневый кэш байтов страниц. Уровень - любой объект с методами get(key) и put(key, value)."""
+
+    def __init__(self, *tiers):
+        self.tiers = list(tiers)
+
+    def get_or_render(self, key, render):
+        for index, tier in enumerate(self.tiers):
+            body = tier.get(key)
+            if body is not None:
+                # Поднимаем найденную страницу в более быстрые уровни
+                for faster in self.tiers[:index]:
+                    faster.put(key, body)
+                return body
+
+        body = render().encode('utf-8')
+        for tier in self.tiers:
+            tier.put(key, body)
+        return body
+
+rendered_page_cache = RenderedPageCache(LRUCache('RENDERED_PAGE_CACHE_SIZE'))  # файловый уровень добавляет create_app
+
+def cached_page(view):
+    """Декоратор для страниц, которые зависят только от шаблонов: отдает готовые байты из кэша.
+
+    Ключ содержит отпечаток шаблонов, поэтому после деплоя с новой разметкой старые копии не используются.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        key = f"{request.path}:{templates_fingerprint()}"
+        etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return conditional_page(etag, lambda: rendered_page_cache.get_or_render(key, lambda: view(*args, **kwargs)))
+    return decorated_function
+
+# Маршруты
+@app.route('/')
+@cached_page
+def index():
+    return render_template('index.html')
+
+@app.route('/support')
+@cached_page
+def support():
+    return render_template('support.html')
+
+@app.route('/rating')
+@read_from_replica
+def rating():
+    def render():
+        # Получаем только пилотов (для публичного рейтинга) из кэша рейтинга
+        leaderboard = leaderboard_cache.get()
+        return render_template('rating.html',
+                             all_pilots=leaderboard['all_pilots'],
+                             strike_pilots=leaderboard['strike_pilots'],
+                             recon_pilots=leaderboard['recon_pilots'],
+                             all_ranks=leaderboard['all_ranks'],
+                             strike_ranks=leaderboard['strike_ranks'],
+                             recon_ranks=leaderboard['recon_ranks'])
+
+    return conditional_page(data_version_etag('rating'), render, data_version_cache.get()[1])
+
+@app.route('/pilot/<string:qr_code>')
+@read_from_replica
+def pilot_profile(qr_code):
+    # Страница зависит от данных и от текущей даты (дни в федерации)
+    today = datetime.now().date()
+    etag = data_version_etag('profile', qr_code, today.isoformat())
+    updated_at = data_version_cache.get()[1]
+    last_modified = max(updated_at, datetime.combine(today, datetime.min.time())) if updated_at else None
+    
+    def render():
+        # Участник или немигрированный старый пилот - одним запросом
+        member = get_member_by_qr_code(qr_code)
+        if member is None:
+            abort(404)
+        
+        owner_column = Achievement.participant_id if member.kind == 'participant' else Achievement.pilot_id
+        achievements = Achievement.query.filter(owner_column == member.id).order_by(Achievement.date_awarded.desc()).all()
+        
+        # Место в категории рейтинга (только для пилотов)
+        category_rank = get_category_rank(member)
+        
+        # Подсчитываем дни в федерации
+        days_in_federation = (datetime.now() - member.join_date).days
+        
+        return render_template('pilot_profile.html', 
+                             pilot=member,  # Передаем как pilot для совместимости шаблона
+                             achievements=achievements,
+                             category_rank=category_rank,
+                             days_in_federation=days_in_federation)
+    
+    return conditional_page(etag, render, last_modified)
+
+@app.route('/admin/login', methods=['GET', 'POST'])
+def admin_login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        
+        admin_username = os.environ.get('ADMIN_USERNAME', 'admin13')
+        admin_password = os.environ.get('ADMIN_PASSWORD', 'admin1313')
+        
+        if username == admin_username and password == admin_password:
+            session.permanent = True  # Применить тайм-аут сессии
+            session['admin'] = True
+            flash('Успешна авторизация!')
+            return redirect(url_for('admin_dashboard'))
+        else:
+            flash('Неверные данные для входа')
+    
+    return render_template('admin_login.html')
+
+@app.route('/admin')
+@admin_required
+def admin_dashboard():
+    
+    # Получаем статистику участников (кэшируется на DASHBOARD_STATS_TTL секунд)
+    stats = dashboard_stats_cache.get(collect_member_stats)
+    
+    # Первая страница участников; остальные страницы и поиск подгружаются через /admin/api/members
+    per_page = app.config['DASHBOARD_PAGE_SIZE']
+    participants = fetch_member_page(limit=per_page + 1)
+    has_next = len(participants) > per_page
+    participants = participants[:per_page]
+    next_cursor = encode_member_cursor(participants[-1]) if has_next else None
+    
+    # Количество достижений одним запросом вместо ленивой загрузки для каждого участника
+    achievement_counts = count_achievements(participants)
+    
+    # Получаем последние 20 записей активности
+    activity_logs = AdminActivityLog.query.order_by(AdminActivityLog.timestamp.desc(), AdminActivityLog.id.desc()).limit(20).all()
+    
+    return render_template('admin_dashboard.html', 
+                         participants=participants,
+                         achievement_counts=achievement_counts,
+                         has_next=has_next,
+                         next_cursor=next_cursor,
+                         categories=CATEGORIES,
+                         activity_logs=activity_logs,
+                         **stats)
+
+@app.route('/admin/api/members')
+@admin_required
+def admin_api_members():
+    """Постраничный JSON-список участников и старых пилотов с фильтром по категории.
+
+    Страницы идут по курсору after (next_cursor предыдущего ответа), без общего количества.
+    Текстовый поиск выполняет /admin/api/search.
+    """
+    per_page = min(max(request.args.get('per_page', app.config['DASHBOARD_PAGE_SIZE'], type=int), 1), 100)
+    category = request.args.get('category', '').strip() or None
+    after = decode_member_cursor(request.args.get('after'))
+    
+    # Берем на одну запись больше, чтобы узнать о наличии следующей страницы
+    members = fetch_member_page(category, after, per_page + 1)
+    has_next = len(members) > per_page
+    members = members[:per_page]
+    achievement_counts = count_achievements(members)
+    
+    return jsonify({
+        'items': [serialize_member(member, achievement_counts) for member in members],
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_member_cursor(members[-1]) if has_next else None
+    })
+
+@app.route('/admin/api/search')
+@admin_required
+def admin_api_search():
+    """Индексный поиск участников по ID, позывному, категории и подкатегории с ранжированием"""
+    search = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', app.config['DASHBOARD_PAGE_SIZE'], type=int), 1), 100)
+    category = request.args.get('category', '').strip() or None
+    
+    if not search:
+        return jsonify({'items': [], 'page': page, 'per_page': per_page, 'has_next': False})
+    
+    # Берем на одну запись больше, чтобы узнать о наличии следующей страницы без COUNT(*)
+    keys = search_members(search, category=category, limit=per_page + 1, offset=(page - 1) * per_page)
+    has_next = len(keys) > per_page
+    members = load_members(keys[:per_page])
+    achievement_counts = count_achievements(members)
+    
+    return jsonify({
+        'items': [serialize_member(member, achievement_counts) for member in members],
+        'page': page,
+        'per_page': per_page,
+        'has_next': has_next
+    })
+
+@app.route('/admin/participant/add', methods=['GET', 'POST'])
+@admin_required
+def admin_add_participant():
+    
+    if request.method == 'POST':
+        callsign = request.form['callsign']
+        category = request.form['category']
+        subcategory = request.form['subcategory']
+        photo_url = request.form.get('photo_url', 'default-pilot.svg')
+        custom_id = request.form.get('custom_id', '').strip()
+        
+        # Загруженный файл фото имеет приоритет над введенным именем файла; на диск он пишется
+        # только после всех проверок формы
+        photo = request.files.get('photo')
+        uploaded_photo = None
+        if photo and photo.filename:
+            uploaded_photo, error = read_uploaded_photo(photo)
+            if error:
+                flash(error, 'error')
+                return render_template('admin_add_participant.html', categories=CATEGORIES)
+        
+        # Проверяем кастомный ID или генерируем автоматически
+        if custom_id:
+            # Валидируем формат
+            if not is_valid_participant_id(custom_id):
+                flash('Неправильний формат ID! Використовуйте формат UAV-XXXX (наприклад, UAV-0012)', 'error')
+                return render_template('admin_add_participant.html', categories=CATEGORIES)
+            
+            # Проверяем уникальность
+            if get_member_by_member_id(custom_id):
+                flash(f'ID {custom_id} вже зайнятий! Оберіть інший номер або залишіть поле порожнім для автогенерації.', 'error')
+                return render_template('admin_add_participant.html', categories=CATEGORIES)
+            
+            participant_id = custom_id
+            advance_participant_id_counter(parse_participant_number(custom_id))
+        else:
+            # Автогенерация ID
+            participant_id = generate_next_participant_id()
+        
+        # Генерируем уникальный QR код
+        qr_code = str(uuid.uuid4())
+        
+        if uploaded_photo:
+            photo_url = save_uploaded_photo(uploaded_photo)
+        
+        participant = Participant(
+            participant_id=participant_id,
+            callsign=callsign,
+            category=category,
+            subcategory=subcategory,
+            photo_url=photo_url,
+            qr_code=qr_code
+        )
+        
+        # Логируем активность в той же транзакции, что и добавление
+        category_info = CATEGORIES.get(category, {})
+        subcategory_name = category_info.get('subcategories', {}).get(subcategory, subcategory)
+        
+        id_method = "вручну" if custom_id else "автоматично"
+        
+        try:
+            db.session.add(participant)
+            log_admin_activity(
+                action_type='add_participant',
+                participant=participant,
+                description=f'Додано нового учасника {callsign} ({participant_id}, ID призначено {id_method}) в категорії {category_info.get("name", category)} - {subcategory_name}'
+            )
+            bump_data_version()
+            db.session.commit()
+            
+            if uploaded_photo:
+                queue_photo_thumbnails(photo_url)
+            
+            # Сохраняем QR код в файл
+            save_participant_qr_code(participant)
+            
+            flash(f'Учасник {callsign} (ID: {participant_id}) успішно додано')
+            return redirect(url_for('admin_dashboard'))
+            
+        except Exception as e:
+            db.session.rollback()
+            if uploaded_photo:
+                discard_uploaded_photo(photo_url)
+            flash(f'Помилка при додаванні учасника: {str(e)}', 'error')
+            return render_template('admin_add_participant.html', categories=CATEGORIES)
+    
+    return render_template('admin_add_participant.html', categories=CATEGORIES)
+
+@app.route('/admin/check_participant_id')
+@admin_required
+def check_participant_id():
+    """AJAX эндпоинт для проверки доступности ID участника"""
+    participant_id = request.args.get('id', '').strip()
+    
+    if not participant_id:
+        return jsonify({'available': True, 'message': ''})
+    
+    # Валидируем формат
+    if not is_valid_participant_id(participant_id):
+        return jsonify({'available': False, 'message': 'Неправильний формат! Використовуйте формат UAV-XXXX'})
+    
+    # Проверяем уникальность
+    existing = get_member_by_member_id(participant_id)
+    if existing:
+        return jsonify({'available': False, 'message': f'ID {participant_id} вже зайнятий учасником "{existing.callsign}"'})
+    
+    return jsonify({'available': True, 'message': f'ID {participant_id} доступний'})
+
+# Массовый импорт участников из CSV
+IMPORT_REQUIRED_COLUMNS = ('callsign', 'category', 'subcategory')
+IMPORT_MAX_REPORTED_ERRORS = 500
+
+def validate_import_row(row):
+    """Проверяет строку CSV. Возвращает (данные, None) или (None, текст ошибки)."""
+    callsign = (row.get('callsign') or '').strip()
+    category = (row.get('category') or '').strip()
+    subcategory = (row.get('subcategory') or '').strip()
+    participant_id = (row.get('participant_id') or '').strip()
+    photo_url = (row.get('photo_url') or '').strip() or 'default-pilot.svg'
+    
+    if not callsign:
+        return None, 'Не вказано позивний'
+    if len(callsign) > Participant.callsign.type.length:
+        return None, 'Позивний задовгий'
+    if category not in CATEGORIES:
+        return None, f'Невідома категорія "{category}"'
+    if subcategory not in CATEGORIES[category]['subcategories']:
+        return None, f'Невідома підкатегорія "{subcategory}" для категорії {category}'
+    if participant_id and not is_valid_participant_id(participant_id):
+        return None, f'Неправильний формат ID "{participant_id}"'
+    if len(photo_url) > Participant.photo_url.type.length:
+        return None, 'Занадто довге значення photo_url'
+    
+    return {
+        'callsign': callsign,
+        'category': category,
+        'subcategory': subcategory,
+        'participant_id': participant_id,
+        'photo_url': photo_url
+    }, None
+
+def insert_import_batch(batch, filename):
+    """Вставляет пачку проверенных строк [(номер строки, данные)] одной транзакцией.
+
+    Позывные и ID проверяются на занятость одним запросом на пачку, номера ID
+    выделяются блоком, строки вставляются одним executemany. Возвращает
+    (количество добавленных, [(номер строки, позывной, ошибка)]).
+    """
+    callsigns = [data['callsign'] for _, data in batch]
+    custom_ids = [data['participant_id'] for _, data in batch if data['participant_id']]
+    
+    taken_callsigns = set(db.session.execute(
+        db.select(Participant.callsign).where(Participant.callsign.in_(callsigns))
+    ).scalars())
+    taken_callsigns.update(db.session.execute(
+        db.select(Pilot.callsign).where(Pilot.callsign.in_(callsigns))
+    ).scalars())
+    taken_ids = set()
+    if custom_ids:
+        taken_ids.update(db.session.execute(
+            db.select(Participant.participant_id).where(Participant.participant_id.in_(custom_ids))
+        ).scalars())
+        taken_ids.update(db.session.execute(
+            db.select(Pilot.pilot_id).where(Pilot.pilot_id.in_(custom_ids))
+        ).scalars())
+    
+    accepted = []
+    errors = []
+    for line_no, data in batch:
+        if data['callsign'] in taken_callsigns:
+            errors.append((line_no, data['callsign'], 'Позивний вже зайнятий'))
+        elif data['participant_id'] in taken_ids:
+            errors.append((line_no, data['callsign'], f'ID {data["participant_id"]} вже зайнятий'))
+        else:
+            accepted.append(data)
+    
+    if not accepted:
+        return 0, errors
+    
+    try:
+        # Сначала сдвигаем счетчик за ручные ID, чтобы автогенерация их не повторила
+        custom_numbers = [parse_participant_number(data['participant_id']) for data in accepted if data['participant_id']]
+        if custom_numbers:
+            advance_participant_id_counter(max(custom_numbers))
+        auto = [data for data in accepted if not data['participant_id']]
+        if auto:
+            for data, number in zip(auto, allocate_participant_numbers(len(auto))):
+                data['participant_id'] = format_participant_id(number)
+        
+        rows = [dict(data, qr_code=str(uuid.uuid4())) for data in accepted]
+        db.session.execute(db.insert(Participant), rows)
+        log_admin_activity(
+            action_type='import_participants',
+            description=f'Імпортовано {len(rows)} учасників з файлу {filename} '
+                        f'({rows[0]["participant_id"]} … {rows[-1]["participant_id"]})'
+        )
+        bump_data_version()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        reported = {error[0] for error in errors}
+        return 0, errors + [(line_no, data['callsign'], f'Пачку не збережено: {e}')
+                            for line_no, data in batch if line_no not in reported]
+    
+    # QR-коды генерируются в фоне; до этого /qr/<qr_code> создаст файл по первому запросу
+    submit_background(render_qr_files, [(qr_file_path(row['participant_id']), qr_target_url(row['qr_code']))
+                                        for row in rows])
+    return len(rows), errors
+
+@app.route('/admin/participants/import', methods=['GET', 'POST'])
+@admin_required
+def admin_import_participants():
+    if request.method != 'POST':
+        return render_template('admin_import_participants.html', categories=CATEGORIES)
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Оберіть CSV-файл для імпорту', 'error')
+        return render_template('admin_import_participants.html', categories=CATEGORIES)
+    
+    # Файл читается потоково: в памяти держится только текущая пачка строк
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames or []
+    except (UnicodeDecodeError, csv.Error) as e:
+        flash(f'Не вдалося прочитати файл (очікується CSV у кодуванні UTF-8): {e}', 'error')
+        return render_template('admin_import_participants.html', categories=CATEGORIES)
+    missing_columns = [column for column in IMPORT_REQUIRED_COLUMNS if column not in fieldnames]
+    if missing_columns:
+        flash(f'У файлі відсутні обов\'язкові колонки: {", ".join(missing_columns)}', 'error')
+        return render_template('admin_import_participants.html', categories=CATEGORIES)
+    
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    result = {'imported': 0, 'rows': 0, 'batches': 0, 'errors': [], 'errors_total': 0}
+    seen_callsigns = set()
+    seen_ids = set()
+    batch = []
+    
+    def report(errors):
+        result['errors_total'] += len(errors)
+        room = IMPORT_MAX_REPORTED_ERRORS - len(result['errors'])
+        result['errors'].extend(errors[:max(room, 0)])
+    
+    def flush_batch():
+        imported, errors = insert_import_batch(batch, upload.filename)
+        result['imported'] += imported
+        result['batches'] += 1 if imported else 0
+        report(errors)
+        batch.clear()
+    
+    try:
+        for line_no, row in enumerate(reader, start=2):
+            result['rows'] += 1
+            data, error = validate_import_row(row)
+            if error is None and data['callsign'] in seen_callsigns:
+                error = 'Позивний повторюється у файлі'
+            if error is None and data['participant_id'] and data['participant_id'] in seen_ids:
+                error = f'ID {data["participant_id"]} повторюється у файлі'
+            if error:
+                report([(line_no, (row.get('callsign') or '').strip(), error)])
+                continue
+            
+            seen_callsigns.add(data['callsign'])
+            if data['participant_id']:
+                seen_ids.add(data['participant_id'])
+            batch.append((line_no, data))
+            if len(batch) >= batch_size:
+                flush_batch()
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Прочитанные до ошибки строки сохраняются; сообщаем, где остановились
+        flash(f'Не вдалося прочитати файл після рядка {result["rows"] + 1}: {e}', 'error')
+    if batch:
+        flush_batch()
+    
+    if result['imported']:
+        flash(f'Імпортовано {result["imported"]} учасників з {result["rows"]} рядків')
+    if result['errors_total']:
+        flash(f'Пропущено рядків з помилками: {result["errors_total"]}', 'error')
+    return render_template('admin_import_participants.html', categories=CATEGORIES, result=result)
+
+# Потоковый экспорт данных (CSV и NDJSON)
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8'
+}
+EXPORT_DATASETS = ('participants', 'pilots', 'achievements', 'activity')
+
+def build_export_query(dataset, category=None, date_from=None, date_to=None, action_type=None):
+    """Строит SELECT по колонкам (без ORM-объектов) для набора данных с учетом фильтров.
+
+    date_from и date_to - даты (включительно); category применяется к участникам,
+    пилотам и владельцам достижений, action_type - к журналу активности. Старые пилоты
+    выгружаются и фильтруются так же, как в member_table: категория military, подкатегория
+    из их старой категории.
+    """
+    if dataset == 'participants':
+        statement = db.select(
+            Participant.id, Participant.participant_id, Participant.callsign, Participant.category,
+            Participant.subcategory, Participant.points, Participant.is_active, Participant.join_date,
+            Participant.qr_code, Participant.photo_url
+        ).order_by(Participant.id)
+        date_column = Participant.join_date
+        if category:
+            statement = statement.where(Participant.category == category)
+    elif dataset == 'pilots':
+        statement = db.select(
+            Pilot.id, Pilot.pilot_id, Pilot.callsign, db.literal(LEGACY_PILOT_CATEGORY).label('category'),
+            legacy_pilot_subcategory().label('subcategory'), Pilot.points,
+            Pilot.join_date, Pilot.qr_code, Pilot.photo_url
+        ).order_by(Pilot.id)
+        date_column = Pilot.join_date
+        if category and category != LEGACY_PILOT_CATEGORY:
+            statement = statement.where(db.false())
+    elif dataset == 'achievements':
+        statement = db.select(
+            Achievement.id,
+            db.case((Achievement.participant_id.isnot(None), 'participant'), else_='pilot').label('owner_type'),
+            db.func.coalesce(Participant.participant_id, Pilot.pilot_id).label('member_id'),
+            db.func.coalesce(Participant.callsign, Pilot.callsign).label('callsign'),
+            Achievement.description, Achievement.points, Achievement.date_awarded
+        ).outerjoin(Participant, Achievement.participant_id == Participant.id) \
+         .outerjoin(Pilot, Achievement.pilot_id == Pilot.id) \
+         .order_by(Achievement.id)
+        date_column = Achievement.date_awarded
+        if category:
+            owner_category = db.case((Achievement.participant_id.isnot(None), Participant.category),
+                                     (Pilot.id.isnot(None), LEGACY_PILOT_CATEGORY))
+            statement = statement.where(owner_category == category)
+    elif dataset == 'activity':
+        statement = db.select(
+            AdminActivityLog.id, AdminActivityLog.timestamp, AdminActivityLog.action_type,
+            AdminActivityLog.participant_name, AdminActivityLog.pilot_name,
+            AdminActivityLog.description, AdminActivityLog.points_awarded
+        ).order_by(AdminActivityLog.id)
+        date_column = AdminActivityLog.timestamp
+        if action_type:
+            statement = statement.where(AdminActivityLog.action_type == action_type)
+    else:
+        raise ValueError(f'Невідомий набір даних "{dataset}"')
+    
+    if date_from:
+        statement = statement.where(date_column >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        statement = statement.where(date_column < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return statement
+
+def parse_export_date(value):
+    """Разбирает дату фильтра в формате YYYY-MM-DD (пустое значение - без фильтра)"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return value
+
+def iter_export(statement, fmt, batch_size=1000):
+    """Генератор фрагментов экспорта: строки читаются курсором пачками по batch_size (yield_per),
+    каждая пачка сериализуется и отдается сразу, поэтому память не зависит от объема выборки.
+    """
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    
+    if writer:
+        writer.writerow(columns)
+    for partition in result.partitions(batch_size):
+        for row in partition:
+            if writer:
+                writer.writerow([_export_value(value) for value in row])
+            else:
+                buffer.write(json.dumps({column: _export_value(value) for column, value in zip(columns, row)},
+                                        ensure_ascii=False))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/admin/export/<string:dataset>')
+@admin_required
+def admin_export(dataset):
+    fmt = request.args.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        statement = build_export_query(
+            dataset,
+            category=request.args.get('category') or None,
+            date_from=parse_export_date(request.args.get('date_from')),
+            date_to=parse_export_date(request.args.get('date_to')),
+            action_type=request.args.get('action_type') or None
+        )
+    except ValueError:
+        abort(400)
+    
+    filename = f"{dataset}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    response = Response(stream_with_context(iter_export(statement, fmt)), content_type=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Не даем прокси (nginx) буферизовать весь ответ
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Журнал активности: keyset-пагинация по (timestamp, id)
+ACTIVITY_ACTIONS = {
+    'add_participant': ('Додавання учасника', '➕'),
+    'edit_participant': ('Редагування учасника', '✏️'),
+    'delete_participant': ('Видалення учасника', '❌'),
+    'add_achievement': ('Досягнення', '🏆'),
+    'import_participants': ('Імпорт з CSV', '📥'),
+    'migrate_pilots': ('Міграція пілотів', '🔄'),
+    'add_pilot': ('Додавання пілота', '➕'),
+    'edit_pilot': ('Редагування пілота', '✏️'),
+    'delete_pilot': ('Видалення пілота', '❌'),
+}
+
+def encode_activity_cursor(log):
+    """Курсор страницы - (timestamp, id) последней показанной записи"""
+    return f"{log.timestamp.isoformat()}_{log.id}"
+
+def decode_activity_cursor(value):
+    """Разбирает курсор страницы; возвращает (timestamp, id) или None для некорректного значения"""
+    try:
+        timestamp, log_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (AttributeError, ValueError):
+        return None
+
+@app.route('/admin/activity')
+@admin_required
+def admin_activity():
+    action_type = request.args.get('action_type', '').strip()
+    member = request.args.get('member', '').strip()
+    cursor = decode_activity_cursor(request.args.get('before'))
+    per_page = app.config['ACTIVITY_PAGE_SIZE']
+    
+    # Без OFFSET: каждая страница - один проход по индексу от курсора, независимо от размера журнала
+    query = AdminActivityLog.query
+    if action_type:
+        query = query.filter(AdminActivityLog.action_type == action_type)
+    if member:
+        query = query.filter(db.or_(AdminActivityLog.participant_name == member,
+                                    AdminActivityLog.pilot_name == member))
+    if cursor:
+        query = query.filter(db.tuple_(AdminActivityLog.timestamp, AdminActivityLog.id) < cursor)
+    logs = query.order_by(AdminActivityLog.timestamp.desc(), AdminActivityLog.id.desc()).limit(per_page + 1).all()
+    
+    next_cursor = encode_activity_cursor(logs[per_page - 1]) if len(logs) > per_page else None
+    return render_template('admin_activity.html',
+                         activity_logs=logs[:per_page],
+                         actions=ACTIVITY_ACTIONS,
+                         action_type=action_type,
+                         member=member,
+                         is_first_page=cursor is None,
+                         next_cursor=next_cursor)
+
+@app.route('/admin/participant/<int:participant_id>/edit', methods=['GET', 'POST'])
+@admin_required
+def admin_edit_participant(participant_id):
+    
+    participant = Participant.query.get_or_404(participant_id)
+    
+    if request.method == 'POST':
+        photo = request.files.get('photo')
+        uploaded_photo = None
+        if photo and photo.filename:
+            uploaded_photo, error = read_uploaded_photo(photo)
+            if error:
+                flash(error, 'error')
+                return render_template('admin_edit_participant.html', participant=participant, categories=CATEGORIES)
+        
+        old_callsign = participant.callsign
         old_category = participant.category
         old_subcategory = participant.subcategory
         old_is_active = participant.is_active
+        old_photo_url = participant.photo_url
         
         participant.callsign = request.form['callsign']
         participant.category = request.form['category']
         participant.subcategory = request.form['subcategory']
-        participant.photo_url = request.form.get('photo_url', participant.photo_url)
+        if not uploaded_photo:
+            participant.photo_url = request.form.get('photo_url', participant.photo_url)
         participant.is_active = 'is_active' in request.form  # Checkbox value
         
-        db.session.commit()
-        
-        # Логируем активность
+        # Логируем активность в той же транзакции, что и изменение
         changes = []
         if old_callsign != participant.callsign:
             changes.append(f'позивний: {old_callsign} → {participant.callsign}')
@@ -618,13 +2551,39 @@ def admin_edit_participant(participant_id):
         if old_is_active != participant.is_active:
             status_text = "активована" if participant.is_active else "деактивована"
             changes.append(f'ID карта: {status_text}')
+        if uploaded_photo or old_photo_url != participant.photo_url:
+            changes.append('фото оновлено')
         
-        if changes:
-            log_admin_activity(
-                action_type='edit_participant',
-                participant=participant,
-                description=f'Редагування учасника {participant.callsign}: {", ".join(changes)}'
-            )
+        # Файл нового фото пишется только здесь и удаляется при любой ошибке до commit
+        uploaded_photo_url = None
+        try:
+            if uploaded_photo:
+                uploaded_photo_url = participant.photo_url = save_uploaded_photo(uploaded_photo)
+            if changes:
+                log_admin_activity(
+                    action_type='edit_participant',
+                    participant=participant,
+                    description=f'Редагування учасника {participant.callsign}: {", ".join(changes)}'
+                )
+            
+            bump_data_version()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if uploaded_photo_url:
+                discard_uploaded_photo(uploaded_photo_url)
+            flash(f'Позивний {request.form["callsign"]} вже зайнятий', 'error')
+            return render_template('admin_edit_participant.html', participant=participant, categories=CATEGORIES)
+        except Exception:
+            db.session.rollback()
+            if uploaded_photo_url:
+                discard_uploaded_photo(uploaded_photo_url)
+            raise
+        
+        if uploaded_photo_url:
+            queue_photo_thumbnails(uploaded_photo_url)
+        if old_photo_url != participant.photo_url:
+            delete_unused_photo(old_photo_url)
         
         flash(f'Учасник {participant.callsign} успішно оновлено')
         return redirect(url_for('admin_dashboard'))
@@ -638,20 +2597,33 @@ def admin_delete_participant(participant_id):
     participant = Participant.query.get_or_404(participant_id)
     participant_callsign = participant.callsign
     participant_participant_id = participant.participant_id
-    
-    # Логируем активность перед удалением
-    log_admin_activity(
-        action_type='delete_participant',
-        participant=participant,
-        description=f'Видалено учасника {participant_callsign} ({participant_participant_id})'
-    )
+    participant_qr_code = participant.qr_code
     
     # Удаляем связанные достижения
     Achievement.query.filter_by(participant_id=participant_id).delete()
     
     db.session.delete(participant)
+    
+    # Запись журнала сохраняется в той же транзакции; ссылку на удаляемую строку не ставим,
+    # имя и ID участника остаются в самой записи
+    log = log_admin_activity(
+        action_type='delete_participant',
+        description=f'Видалено учасника {participant_callsign} ({participant_participant_id})'
+    )
+    log.participant_name = participant_callsign
+    bump_data_version()
     db.session.commit()
     
+    # QR-код удаленного участника: кэш этого воркера и файл; другие воркеры перепроверят
+    # существование участника после смены версии данных
+    qr_png_cache.pop(participant_qr_code)
+    try:
+        os.remove(qr_file_path(participant_participant_id))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        app.logger.warning(f"Не удалось удалить QR-код участника {participant_participant_id}: {e}")
+    
     flash(f'Учасник {participant_callsign} успішно видалено')
     return redirect(url_for('admin_dashboard'))
 
@@ -659,24 +2631,21 @@ def admin_delete_participant(participant_id):
 @admin_required
 def admin_add_participant_achievement(participant_id):
     
-    participant = Participant.query.get_or_404(participant_id)
+    # Загружаем только нужные колонки - сами очки читать не нужно
+    participant = db.session.execute(
+        db.select(Participant.id, Participant.callsign, Participant.category, Participant.subcategory)
+        .where(Participant.id == participant_id)
+    ).first()
+    if participant is None:
+        abort(404)
     description = request.form['description']
     points = int(request.form.get('points', 0))  # Для не-пилотов может быть 0
     
-    achievement = Achievement(
-        participant_id=participant_id,
-        description=description,
-        points=points
-    )
-    
-    # Обновляем общие очки участника только для пилотов
-    if participant.is_pilot() and points > 0:
-        participant.points += points
-    
-    db.session.add(achievement)
-    db.session.commit()
+    # Достижение и начисление очков (только для пилотов) - в одной транзакции
+    add_achievement(Participant, participant_id, description, points,
+                    award=is_pilot_subcategory(participant.category, participant.subcategory) and points > 0)
     
-    # Логируем активность
+    # Логируем активность в той же транзакции
     if points > 0:
         log_admin_activity(
             action_type='add_achievement',
@@ -690,6 +2659,7 @@ def admin_add_participant_achievement(participant_id):
             participant=participant,
             description=f'Додано досягнення "{description}" для учасника {participant.callsign}'
         )
+    db.session.commit()
     
     flash(f'Достижение добавлено для {participant.callsign}')
     return redirect(url_for('admin_dashboard'))
@@ -704,336 +2674,864 @@ def admin_logout():
 
 
 
-@app.route('/qr/<string:qr_code>')
-def generate_qr(qr_code):
-    from flask import send_file
-    
-    # Пробуем найти среди новых участников
-    participant = Participant.query.filter_by(qr_code=qr_code).first()
-    if participant:
-        # Путь к файлу QR кода - используем существующий qr_code
-        qr_filename = f"{participant.participant_id}.png"
-        qr_filepath = os.path.join('static', 'qr_codes', qr_filename)
-        
-        # Проверяем, существует ли файл, если нет - создаем с существующим qr_code
-        if not os.path.exists(qr_filepath):
-            # Создаем директорию если её нет
-            os.makedirs('static/qr_codes', exist_ok=True)
-            
-            # Создаем QR код с существующим qr_code из БД
-            qr = qrcode.QRCode(version=1, box_size=10, border=2)
-            qr.add_data(f'https://ufmup.com/pilot/{participant.qr_code}')
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Сохраняем в файл
-            img.save(qr_filepath)
-        
-        # Возвращаем файл изображения
-        return send_file(qr_filepath, mimetype='image/png')
-    
-    # Если не найден среди участников, ищем среди старых пилотов
-    pilot = Pilot.query.filter_by(qr_code=qr_code).first()
-    if pilot:
-        # Путь к файлу QR кода - используем существующий qr_code
-        qr_filename = f"{pilot.pilot_id}.png"
-        qr_filepath = os.path.join('static', 'qr_codes', qr_filename)
-        
-        # Проверяем, существует ли файл, если нет - создаем с существующим qr_code
-        if not os.path.exists(qr_filepath):
-            # Создаем директорию если её нет
-            os.makedirs('static/qr_codes', exist_ok=True)
-            
-            # Создаем QR код с существующим qr_code из БД
-            qr = qrcode.QRCode(version=1, box_size=10, border=2)
-            qr.add_data(f'https://ufmup.com/pilot/{pilot.qr_code}')
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Сохраняем в файл
-            img.save(qr_filepath)
-        
-        # Возвращаем файл изображения
-        return send_file(qr_filepath, mimetype='image/png')
-    
-    # Если не найден ни один участник, возвращаем ошибку 404
-    from flask import abort
-    abort(404)
+# QR-коды: PNG кэшируется в памяти воркера, содержимое для данного qr_code никогда не меняется.
+# Значение - (png, версия данных, при которой участник с этим qr_code точно существовал)
+qr_png_cache = LRUCache('QR_CACHE_SIZE')
 
-# Функция для сохранения QR кода участника
-def save_participant_qr_code(participant):
-    qr_filename = f"{participant.participant_id}.png"
-    qr_filepath = os.path.join('static', 'qr_codes', qr_filename)
+def find_qr_member_id(qr_code):
+    """ID участника или немигрированного старого пилота с этим qr_code (None, если его нет)"""
+    return db.session.execute(
+        db.select(member_table.c.member_id).where(member_table.c.qr_code == qr_code).limit(1)
+    ).scalar()
+
+def qr_target_url(qr_code):
+    """URL профиля, который кодируется в QR-коде"""
+    return f"{app.config['BASE_URL'].rstrip('/')}/pilot/{qr_code}"
+
+def qr_etag(qr_code):
+    """Сильный ETag QR-кода: зависит только от закодированного URL"""
+    return hashlib.sha256(qr_target_url(qr_code).encode('utf-8')).hexdigest()[:32]
+
+def render_qr_png_for_url(url):
+    """Генерирует PNG QR-кода для URL. URL сохраняется в метаданных PNG для проверки актуальности файла."""
+    import qrcode  # вместе с Pillow загружается только при первой генерации QR-кода
+    from PIL.PngImagePlugin import PngInfo
     
-    # Создаем QR код
+    started_at = time.perf_counter()
     qr = qrcode.QRCode(version=1, box_size=10, border=2)
-    qr.add_data(f'https://ufmup.com/pilot/{participant.qr_code}')  # Ссылка на правильный сайт
+    qr.add_data(url)
     qr.make(fit=True)
     
     img = qr.make_image(fill_color="black", back_color="white")
-    img.save(qr_filepath)
-    
-    return qr_filename
+    info = PngInfo()
+    info.add_text('url', url)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', pnginfo=info)
+    metrics.observe('qr_render_duration_seconds', time.perf_counter() - started_at)
+    return buffer.getvalue()
 
-# Для обратной совместимости
-def save_pilot_qr_code(pilot):
-    qr_filename = f"{pilot.pilot_id}.png"
-    qr_filepath = os.path.join('static', 'qr_codes', qr_filename)
+def render_qr_png(qr_code):
+    """Генерирует PNG QR-кода участника и возвращает его байты"""
+    return render_qr_png_for_url(qr_target_url(qr_code))
+
+def write_file_atomic(path, data):
+    """Записывает файл через временный файл и os.replace, чтобы читатели не видели его частично"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Уникальное имя: один файл могут одновременно писать несколько потоков и процессов
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)  # mkstemp создает файл с правами 0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def is_qr_file_current(path, url):
+    """Проверяет, что файл QR-кода существует и кодирует нужный URL (читается только заголовок PNG)"""
+    from PIL import Image
     
-    # Создаем QR код
-    qr = qrcode.QRCode(version=1, box_size=10, border=2)
-    qr.add_data(f'https://ufmup.com/pilot/{pilot.qr_code}')
-    qr.make(fit=True)
+    try:
+        with Image.open(path) as img:
+            return img.text.get('url') == url
+    except (OSError, ValueError):
+        return False
+
+def qr_file_path(member_id):
+    """Путь к файлу QR-кода участника в static/qr_codes"""
+    return os.path.join('static', 'qr_codes', f"{member_id}.png")
+
+def _qr_response(png, etag):
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={app.config['QR_CACHE_MAX_AGE']}, immutable"
+    return response
+
+@app.route('/qr/<string:qr_code>')
+@read_from_replica
+def generate_qr(qr_code):
+    etag = qr_etag(qr_code)
+    
+    # Запись кэша, подтвержденная при текущей версии данных, отвечает без БД. После любой записи
+    # (например, удаления участника в другом воркере) существование проверяется заново одним запросом,
+    # а PNG берется из кэша
+    data_version = get_data_version()
+    cached = qr_png_cache.get(qr_code)
+    if cached is not None and cached[1] != data_version:
+        if find_qr_member_id(qr_code) is None:
+            qr_png_cache.pop(qr_code)
+            abort(404)
+        cached = (cached[0], data_version)
+        qr_png_cache.put(qr_code, cached)
+    
+    if cached is None:
+        # Участник или немигрированный старый пилот - одним запросом
+        member_id = find_qr_member_id(qr_code)
+        if member_id is None:
+            # Если не найден ни один участник, возвращаем ошибку 404
+            abort(404)
+        
+        # Клиент уже имеет эту картинку - файл не читаем
+        if request.if_none_match.contains(etag):
+            response = _qr_response(b'', etag)
+            response.status_code = 304
+            return response
+        
+        # Используем сохраненный файл, если он есть; иначе создаем его с существующим qr_code
+        qr_filepath = qr_file_path(member_id)
+        if os.path.exists(qr_filepath):
+            with open(qr_filepath, 'rb') as f:
+                png = f.read()
+        else:
+            png = render_qr_png(qr_code)
+            write_file_atomic(qr_filepath, png)
+        
+        cached = (png, data_version)
+        qr_png_cache.put(qr_code, cached)
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(qr_filepath)
+    # Клиент уже имеет эту картинку - отвечаем 304
+    if request.if_none_match.contains(etag):
+        response = _qr_response(b'', etag)
+        response.status_code = 304
+        return response
     
-    return qr_filename
-
-def ensure_participant_has_qr_code(participant):
-    """Гарантирует, что у участника есть QR код. Для существующих участников сохраняет старый QR код."""
-    if not participant.qr_code:
-        # Генерируем новый UUID только если QR код отсутствует полностью
-        participant.qr_code = str(uuid.uuid4())
-        db.session.commit()
-        print(f"Сгенерирован новый QR код для участника {participant.callsign}: {participant.qr_code}")
-    return participant.qr_code
-
-def ensure_pilot_has_qr_code(pilot):
-    """Гарантирует, что у пилота есть QR код. Для существующих пилотов сохраняет старый QR код."""
-    if not pilot.qr_code:
-        # Генерируем новый UUID только если QR код отсутствует полностью
-        pilot.qr_code = str(uuid.uuid4())
-        db.session.commit()
-        print(f"Сгенерирован новый QR код для пилота {pilot.callsign}: {pilot.qr_code}")
-    return pilot.qr_code
+    return _qr_response(cached[0], etag)
 
-def migrate_database():
-    """Обновляет схему базы данных для новых таблиц"""
-    print("Обновляем схему базы данных...")
+# Функция для сохранения QR кода участника
+def save_participant_qr_code(participant):
+    qr_filepath = qr_file_path(participant.participant_id)
     
-    # Создаем все таблицы (включая новые колонки)
-    db.create_all()
+    png = render_qr_png(participant.qr_code)
+    write_file_atomic(qr_filepath, png)
+    qr_png_cache.put(participant.qr_code, (png, get_data_version()))
     
-    # Проверяем и добавляем колонку participant_id в таблицу achievement
+    return os.path.basename(qr_filepath)
+
+# Фоновые задачи воркера: выполняются в пуле потоков после ответа на запрос
+_background_executor = None
+_background_executor_lock = threading.Lock()
+
+def _run_background(fn, args):
     try:
-        db.session.execute(db.text("SELECT participant_id FROM achievement LIMIT 1"))
-        print("Колонка achievement.participant_id уже существует")
+        fn(*args)
     except Exception:
-        print("Добавляем колонку participant_id в таблицу achievement...")
-        try:
-            db.session.execute(db.text("ALTER TABLE achievement ADD COLUMN participant_id INTEGER"))
-            db.session.commit()
-            print("Колонка achievement.participant_id успешно добавлена")
-        except Exception as e:
-            print(f"Ошибка при добавлении колонки achievement.participant_id: {e}")
-            db.session.rollback()
-    
-    # Проверяем и добавляем колонки в таблицу admin_activity_log
+        app.logger.exception(f"Ошибка фоновой задачи {fn.__name__}")
+
+def submit_background(fn, *args):
+    """Ставит fn(*args) в очередь фонового пула. Пул создается лениво, уже в процессе воркера."""
+    global _background_executor
+    with _background_executor_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(max_workers=app.config['BACKGROUND_WORKERS'],
+                                                      thread_name_prefix='background')
+    return _background_executor.submit(_run_background, fn, args)
+
+def render_qr_files(tasks):
+    """Генерирует файлы QR-кодов для списка (путь, URL); уже актуальные файлы пропускаются"""
+    for path, url in tasks:
+        _warm_qr_file((path, url, 'stale'))
+
+# Фото участников: оригинал сохраняется сразу, WebP-миниатюры генерируются в фоновом пуле
+PHOTO_UPLOAD_DIR = os.path.join(app.static_folder, 'images', 'uploads')
+PHOTO_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+PHOTO_THUMBNAIL_SIZES = (64, 128, 256)  # по возрастанию: самая большая миниатюра пишется последней
+
+def photo_thumbnail_name(filename, size):
+    return f"{os.path.splitext(filename)[0]}-{size}.webp"
+
+def read_uploaded_photo(upload):
+    """Читает и проверяет загруженное изображение, ничего не записывая на диск.
+
+    Возвращает ((данные, расширение), None) или (None, ошибка).
+    """
+    max_bytes = app.config['PHOTO_UPLOAD_MAX_BYTES']
+    data = upload.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return None, f'Файл фото завеликий (максимум {max_bytes // (1024 * 1024)} МБ)'
+
+    from PIL import Image
+
     try:
-        db.session.execute(db.text("SELECT participant_id FROM admin_activity_log LIMIT 1"))
-        print("Колонка admin_activity_log.participant_id уже существует")
-    except Exception:
-        print("Добавляем колонки participant_id и participant_name в таблицу admin_activity_log...")
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+            image_format = img.format
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None, 'Файл фото не є зображенням або пошкоджений'
+
+    if image_format not in PHOTO_FORMATS:
+        return None, 'Підтримуються лише фото у форматах JPEG, PNG та WebP'
+    return (data, PHOTO_FORMATS[image_format]), None
+
+def save_uploaded_photo(photo):
+    """Сохраняет оригинал проверенного фото (результат read_uploaded_photo) и возвращает photo_url.
+
+    Вызывается после всех проверок формы; миниатюры ставятся в очередь после commit
+    (queue_photo_thumbnails), при ошибке commit файл удаляет discard_uploaded_photo.
+    """
+    data, extension = photo
+    filename = f"{uuid.uuid4().hex}{extension}"
+    write_file_atomic(os.path.join(PHOTO_UPLOAD_DIR, filename), data)
+    return f"uploads/{filename}"
+
+def queue_photo_thumbnails(photo_url):
+    submit_background(render_photo_thumbnails, photo_url[len('uploads/'):])
+
+def discard_uploaded_photo(photo_url):
+    """Удаляет загруженное фото и его миниатюры (если они уже есть)"""
+    filename = photo_url[len('uploads/'):]
+    paths = [os.path.join(PHOTO_UPLOAD_DIR, filename)]
+    paths += [os.path.join(PHOTO_UPLOAD_DIR, photo_thumbnail_name(filename, size)) for size in PHOTO_THUMBNAIL_SIZES]
+    for path in paths:
         try:
-            db.session.execute(db.text("ALTER TABLE admin_activity_log ADD COLUMN participant_id INTEGER"))
-            db.session.execute(db.text("ALTER TABLE admin_activity_log ADD COLUMN participant_name VARCHAR(100)"))
-            db.session.commit()
-            print("Колонки admin_activity_log успешно добавлены")
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            app.logger.warning(f"Не удалось удалить файл фото {path}: {e}")
+
+def delete_unused_photo(photo_url):
+    """Удаляет замененное загруженное фото, если на него больше не ссылается ни участник, ни старый пилот
+    (при миграции пилот и участник получают один и тот же photo_url)"""
+    if not photo_url or not photo_url.startswith('uploads/'):
+        return
+    still_used = db.session.execute(db.select(
+        db.select(Participant.id).where(Participant.photo_url == photo_url).exists()
+        | db.select(Pilot.id).where(Pilot.photo_url == photo_url).exists()
+    )).scalar()
+    if not still_used:
+        discard_uploaded_photo(photo_url)
+
+def render_photo_thumbnails(filename, only_missing=False):
+    """Генерирует квадратные WebP-миниатюры загруженного фото для всех размеров из PHOTO_THUMBNAIL_SIZES"""
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(PHOTO_UPLOAD_DIR, filename)) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        for size in PHOTO_THUMBNAIL_SIZES:
+            path = os.path.join(PHOTO_UPLOAD_DIR, photo_thumbnail_name(filename, size))
+            if only_missing and os.path.exists(path):
+                continue
+            thumbnail = ImageOps.fit(img, (size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format='WEBP', quality=80, method=6)
+            write_file_atomic(path, buffer.getvalue())
+
+def photo_thumbnails(photo_url):
+    """[(URL, ширина)] миниатюр загруженного фото или пустой список, если миниатюры еще не готовы"""
+    if not photo_url or not photo_url.startswith('uploads/'):
+        return []
+    filename = photo_url[len('uploads/'):]
+    if not os.path.exists(os.path.join(PHOTO_UPLOAD_DIR, photo_thumbnail_name(filename, PHOTO_THUMBNAIL_SIZES[-1]))):
+        return []
+    return [(url_for('static', filename=f"images/uploads/{photo_thumbnail_name(filename, size)}"), size)
+            for size in PHOTO_THUMBNAIL_SIZES]
+
+def photo_src(photo_url):
+    """URL фото для атрибута src: самая маленькая миниатюра, если она есть, иначе исходный файл"""
+    thumbnails = photo_thumbnails(photo_url)
+    if thumbnails:
+        return thumbnails[0][0]
+    return url_for('static', filename='images/' + (photo_url or 'default-pilot.svg'))
+
+def photo_srcset(photo_url):
+    """Значение srcset с миниатюрами фото (пустая строка для фото без миниатюр)"""
+    return ', '.join(f"{url} {size}w" for url, size in photo_thumbnails(photo_url))
+
+app.jinja_env.globals.update(photo_src=photo_src, photo_srcset=photo_srcset)
+
+@app.cli.command('photos-thumbnails')
+@click.option('--force', is_flag=True, help='Перегенерировать все миниатюры.')
+def photos_thumbnails_command(force):
+    """Генерирует отсутствующие миниатюры загруженных фото (например, после перезапуска во время обработки)."""
+    if not os.path.isdir(PHOTO_UPLOAD_DIR):
+        click.echo('Загруженных фото нет')
+        return
+
+    thumbnail_suffixes = tuple(f"-{size}.webp" for size in PHOTO_THUMBNAIL_SIZES)
+    counts = {'processed': 0, 'failed': 0}
+    for filename in sorted(os.listdir(PHOTO_UPLOAD_DIR)):
+        if filename.endswith(thumbnail_suffixes) or not filename.endswith(tuple(PHOTO_FORMATS.values())):
+            continue
+        try:
+            render_photo_thumbnails(filename, only_missing=not force)
+            counts['processed'] += 1
         except Exception as e:
-            print(f"Ошибка при добавлении колонок admin_activity_log: {e}")
-            db.session.rollback()
+            counts['failed'] += 1
+            click.echo(f"Ошибка обработки {filename}: {e}", err=True)
+    click.echo(f"Обработано фото: {counts['processed']}, ошибок: {counts['failed']}")
+
+# Массовая предварительная генерация QR-кодов (flask qr-warm)
+def _warm_qr_file(task):
+    """Выполняется в процессе пула: генерирует файл QR-кода, если он отсутствует или устарел"""
+    path, url, mode = task
+    if mode == 'only_missing' and os.path.exists(path):
+        return 'skipped'
+    if mode == 'stale' and is_qr_file_current(path, url):
+        return 'skipped'
+    write_file_atomic(path, render_qr_png_for_url(url))
+    return 'rendered'
+
+def iter_qr_batches(batch_size):
+    """Потоково выдает пачки (ID участника, qr_code) из обеих таблиц без загрузки ORM-объектов"""
+    participants = db.select(Participant.participant_id, Participant.qr_code) \
+        .where(Participant.qr_code.isnot(None))
+    # Мигрированные пилоты уже учтены среди участников
+    pilots = db.select(Pilot.pilot_id, Pilot.qr_code) \
+        .where(Pilot.qr_code.isnot(None)) \
+        .where(~db.select(Participant.id).where(Participant.qr_code == Pilot.qr_code).exists())
+    
+    for statement in (participants, pilots):
+        result = db.session.execute(statement.execution_options(yield_per=batch_size))
+        for partition in result.partitions(batch_size):
+            yield partition
+
+@app.cli.command('qr-warm')
+@click.option('--only-missing', is_flag=True, help='Генерировать только отсутствующие файлы (без проверки актуальности).')
+@click.option('--force', is_flag=True, help='Перегенерировать все файлы.')
+@click.option('--workers', type=int, default=None, help='Количество процессов (по умолчанию - число CPU).')
+@click.option('--batch-size', type=int, default=500, show_default=True, help='Размер пачки чтения из БД.')
+def qr_warm_command(only_missing, force, workers, batch_size):
+    """Заранее генерирует PNG QR-кодов всех участников в static/qr_codes."""
+    if only_missing and force:
+        raise click.UsageError('--only-missing и --force нельзя использовать вместе')
+    mode = 'force' if force else 'only_missing' if only_missing else 'stale'
+    
+    os.makedirs(os.path.join('static', 'qr_codes'), exist_ok=True)
+    counts = {'rendered': 0, 'skipped': 0, 'failed': 0}
+    started = time.monotonic()
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch in iter_qr_batches(batch_size):
+            tasks = [(qr_file_path(member_id), qr_target_url(qr_code), mode) for member_id, qr_code in batch]
+            futures = [executor.submit(_warm_qr_file, task) for task in tasks]
+            for task, future in zip(tasks, futures):
+                try:
+                    counts[future.result()] += 1
+                except Exception as e:
+                    counts['failed'] += 1
+                    click.echo(f"Ошибка генерации {task[0]}: {e}", err=True)
+            
+            processed = sum(counts.values())
+            elapsed = max(time.monotonic() - started, 1e-6)
+            click.echo(f"Обработано {processed} ({processed / elapsed:.0f}/с): "
+                       f"создано {counts['rendered']}, пропущено {counts['skipped']}, ошибок {counts['failed']}")
+    
+    elapsed = max(time.monotonic() - started, 1e-6)
+    click.echo(f"Готово за {elapsed:.1f} с: создано {counts['rendered']} "
+               f"({counts['rendered'] / elapsed:.0f} QR/с), пропущено {counts['skipped']}, ошибок {counts['failed']}")
+
+@app.cli.command('export')
+@click.argument('dataset', type=click.Choice(EXPORT_DATASETS))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), default='-', help='Файл результата (по умолчанию stdout).')
+@click.option('--category', default=None, help='Категория участников/пилотов/владельцев достижений.')
+@click.option('--date-from', type=click.DateTime(['%Y-%m-%d']), default=None, help='Начальная дата (включительно).')
+@click.option('--date-to', type=click.DateTime(['%Y-%m-%d']), default=None, help='Конечная дата (включительно).')
+@click.option('--action-type', default=None, help='Тип действия для журнала активности.')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Размер пачки чтения из БД.')
+def export_command(dataset, fmt, output, category, date_from, date_to, action_type, batch_size):
+    """Потоково выгружает участников, пилотов, достижения или журнал активности в CSV/NDJSON."""
+    statement = build_export_query(
+        dataset,
+        category=category,
+        date_from=date_from.date() if date_from else None,
+        date_to=date_to.date() if date_to else None,
+        action_type=action_type
+    )
+    with click.open_file(output, 'w', encoding='utf-8') as f:
+        for chunk in iter_export(statement, fmt, batch_size):
+            f.write(chunk)
+
+# Архивация журнала активности (flask activity-archive)
+def archive_activity_logs(cutoff, archive_dir, batch_size=5000):
+    """Переносит записи журнала старше cutoff в помесячные файлы NDJSON.gz и удаляет их из таблицы.
+
+    Каждая пачка дописывается в файл отдельным gzip-блоком и сбрасывается на диск до удаления
+    строк из БД, поэтому при прерывании запись может попасть в архив дважды, но не потеряется.
+    Возвращает количество перенесенных записей.
+    """
+    columns = list(AdminActivityLog.__table__.columns)
+    os.makedirs(archive_dir, exist_ok=True)
+    total = 0
+    
+    while True:
+        rows = db.session.execute(
+            db.select(*columns)
+            .where(AdminActivityLog.timestamp < cutoff)
+            .order_by(AdminActivityLog.timestamp, AdminActivityLog.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row.timestamp.strftime('%Y-%m'), []).append(row)
+        for month, month_rows in by_month.items():
+            with open(os.path.join(archive_dir, f"activity-{month}.ndjson.gz"), 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                    for row in month_rows:
+                        line = json.dumps({key: _export_value(value) for key, value in row._mapping.items()},
+                                          ensure_ascii=False)
+                        archive.write(f"{line}\n".encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+        
+        db.session.execute(db.delete(AdminActivityLog).where(AdminActivityLog.id.in_([row.id for row in rows])))
+        db.session.commit()
+        total += len(rows)
+    
+    return total
+
+@app.cli.command('activity-archive')
+@click.option('--days', type=int, default=None, help='Хранить в таблице записи за последние N дней (по умолчанию ACTIVITY_RETENTION_DAYS).')
+@click.option('--archive-dir', default=None, help='Каталог архива (по умолчанию ACTIVITY_ARCHIVE_DIR).')
+@click.option('--batch-size', type=int, default=5000, show_default=True, help='Количество записей в одной транзакции удаления.')
+@click.option('--dry-run', is_flag=True, help='Только посчитать записи, которые будут перенесены.')
+def activity_archive_command(days, archive_dir, batch_size, dry_run):
+    """Переносит старые записи журнала активности в архивные файлы NDJSON.gz."""
+    days = app.config['ACTIVITY_RETENTION_DAYS'] if days is None else days
+    archive_dir = archive_dir or app.config['ACTIVITY_ARCHIVE_DIR']
+    cutoff = datetime.now() - timedelta(days=days)
+    
+    if dry_run:
+        count = db.session.execute(
+            db.select(db.func.count()).select_from(AdminActivityLog).where(AdminActivityLog.timestamp < cutoff)
+        ).scalar()
+        click.echo(f"Будет перенесено записей старше {cutoff:%Y-%m-%d %H:%M}: {count}")
+        return
     
-    # Проверяем и добавляем колонку is_active в таблицу participant
+    total = archive_activity_logs(cutoff, archive_dir, batch_size)
+    click.echo(f"Перенесено в {archive_dir} записей старше {cutoff:%Y-%m-%d %H:%M}: {total}")
+
+# Статика: сборка с хэшем содержимого в именах файлов, сжатые варианты и вечное кэширование клиентом
+ASSET_BUILD_DIR = os.path.join(app.static_folder, 'dist')
+ASSET_EXCLUDED_DIRS = ('dist', 'qr_codes', 'images/uploads')
+ASSET_COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt')
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # в порядке предпочтения
+CSS_URL_PATTERN = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+
+def hashed_asset_name(path, data):
+    """css/style.css -> css/style.<хэш>.css"""
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+def rewrite_css_urls(css_path, css, manifest):
+    """Заменяет относительные url(...) в CSS на собранные имена файлов"""
+    base = posixpath.dirname(css_path)
+
+    def replace(match):
+        quote, ref = match.groups()
+        ref_path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+        target = posixpath.normpath(posixpath.join(base, ref_path))
+        if target not in manifest:
+            return match.group(0)
+        return f"url({quote}{posixpath.relpath(manifest[target], base)}{suffix}{quote})"
+
+    return CSS_URL_PATTERN.sub(replace, css)
+
+def load_brotli():
+    """Модуль brotli, если он установлен (нужен только при сборке статики)"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def compress_asset(encoding, data):
+    if encoding == 'br':
+        return load_brotli().compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def build_assets(static_dir, build_dir):
+    """Копирует статику в build_dir под именами с хэшем, создает .br/.gz и записывает manifest.json.
+
+    Файлы прошлых сборок не удаляются: закэшированные клиентами страницы продолжают на них ссылаться.
+    """
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir).replace(os.sep, '/')
+        dirs[:] = [d for d in dirs if posixpath.normpath(posixpath.join(rel_root, d)) not in ASSET_EXCLUDED_DIRS]
+        sources.extend(posixpath.normpath(posixpath.join(rel_root, name)) for name in files)
+
+    # CSS собираются последними: их хэш зависит от имен шрифтов и картинок, на которые они ссылаются
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+    has_brotli = load_brotli() is not None
+    encodings = [(encoding, suffix) for encoding, suffix in ASSET_ENCODINGS if encoding != 'br' or has_brotli]
+
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css_urls(path, data.decode('utf-8'), manifest).encode('utf-8')
+
+        manifest[path] = hashed_asset_name(path, data)
+        target = os.path.join(build_dir, manifest[path])
+        if not os.path.exists(target):
+            write_file_atomic(target, data)
+
+        if path.endswith(ASSET_COMPRESSIBLE_EXTENSIONS):
+            for encoding, suffix in encodings:
+                if os.path.exists(target + suffix):
+                    continue
+                compressed = compress_asset(encoding, data)
+                if len(compressed) < len(data):
+                    write_file_atomic(target + suffix, compressed)
+
+    write_file_atomic(os.path.join(build_dir, 'manifest.json'),
+                      json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+def load_asset_manifest():
+    """Манифест последней сборки; без сборки статика отдается как раньше через /static"""
+    try:
+        with open(os.path.join(ASSET_BUILD_DIR, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+asset_manifest = load_asset_manifest()
+
+def asset_url_for(endpoint, **values):
+    """url_for для шаблонов: файлы из манифеста сборки получают URL с хэшем"""
+    if endpoint == 'static':
+        hashed = asset_manifest.get(values.get('filename'))
+        if hashed is not None:
+            values['filename'] = hashed
+            return url_for('asset_file', **values)
+    return url_for(endpoint, **values)
+
+app.jinja_env.globals['url_for'] = asset_url_for
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in ASSET_ENCODINGS:
+        variant = safe_join(ASSET_BUILD_DIR, filename + suffix)
+        if request.accept_encodings[encoding] and variant and os.path.isfile(variant):
+            response = send_from_directory(ASSET_BUILD_DIR, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(ASSET_BUILD_DIR, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = f"public, max-age={app.config['ASSET_CACHE_MAX_AGE']}, immutable"
+    return response
+
+@app.cli.command('assets-build')
+def assets_build_command():
+    """Собирает статику с хэшами в именах и сжатыми вариантами в static/dist."""
+    if load_brotli() is None:
+        click.echo('Модуль brotli не установлен - создаются только gzip-варианты', err=True)
+    started = time.monotonic()
+    manifest = build_assets(app.static_folder, ASSET_BUILD_DIR)
+    click.echo(f"Собрано файлов: {len(manifest)} за {time.monotonic() - started:.1f} с в {ASSET_BUILD_DIR}")
+
+# Версионированные миграции схемы: каждый шаг идемпотентен и применяется один раз
+def _add_column_if_missing(table, column, ddl):
+    existing = {c['name'] for c in db.inspect(db.engine).get_columns(table)}
+    if column not in existing:
+        print(f"Добавляем колонку {table}.{column}...")
+        db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _migration_legacy_columns():
+    # Колонки, добавленные после первого релиза
+    _add_column_if_missing('achievement', 'participant_id', 'INTEGER')
+    _add_column_if_missing('admin_activity_log', 'participant_id', 'INTEGER')
+    _add_column_if_missing('admin_activity_log', 'participant_name', 'VARCHAR(100)')
+    _add_column_if_missing('participant', 'is_active', 'BOOLEAN NOT NULL DEFAULT TRUE')
+
+def _migration_data_version():
+    # Строка версии данных для кэша рейтинга
+    if db.session.get(DataVersion, 1) is None:
+        db.session.add(DataVersion(id=1, version=0))
+
+def _migration_performance_indexes():
+    # Индексы под горячие запросы: рейтинг, профиль, админ-панель
+    for index_name, table, columns in PERFORMANCE_INDEXES:
+        db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
+
+PERFORMANCE_INDEXES = [
+    ('ix_participant_category_subcategory_points', 'participant', 'category, subcategory, points'),
+    ('ix_pilot_category_points', 'pilot', 'category, points'),
+    ('ix_achievement_participant_date', 'achievement', 'participant_id, date_awarded'),
+    ('ix_achievement_pilot_date', 'achievement', 'pilot_id, date_awarded'),
+    ('ix_admin_activity_log_timestamp', 'admin_activity_log', 'timestamp'),
+]
+
+def _migration_activity_log_indexes():
+    for index_name, table, columns in ACTIVITY_LOG_INDEXES:
+        db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
+    # Индекс только по timestamp покрывается составным (timestamp, id)
+    db.session.execute(db.text("DROP INDEX IF EXISTS ix_admin_activity_log_timestamp"))
+
+def _migration_checkpoint_table():
+    MigrationCheckpoint.__table__.create(bind=db.session.connection(), checkfirst=True)
+
+ACTIVITY_LOG_INDEXES = [
+    ('ix_admin_activity_log_timestamp_id', 'admin_activity_log', 'timestamp, id'),
+    ('ix_admin_activity_log_action_timestamp_id', 'admin_activity_log', 'action_type, timestamp, id'),
+    ('ix_admin_activity_log_participant_timestamp_id', 'admin_activity_log', 'participant_name, timestamp, id'),
+]
+
+def _migration_member_order_indexes():
+    # Keyset-пагинация списка участников в админ-панели (см. fetch_member_page)
+    for index_name, table, columns in MEMBER_ORDER_INDEXES:
+        db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
+
+def _migration_activity_log_pilot_index():
+    # Фильтр журнала по участнику проверяет и participant_name, и pilot_name (записи старых пилотов)
+    db.session.execute(db.text(
+        "CREATE INDEX IF NOT EXISTS ix_admin_activity_log_pilot_timestamp_id "
+        "ON admin_activity_log (pilot_name, timestamp, id)"))
+
+# (версия, описание, функция). Новые шаги добавляются только в конец списка.
+MIGRATIONS = [
+    (1, 'Колонки participant_id, participant_name и is_active', _migration_legacy_columns),
+    (2, 'Строка версии данных', _migration_data_version),
+    (3, 'Счетчик ID участников', ensure_id_allocator),
+    (4, 'Поисковый индекс участников', ensure_search_index),
+    (5, 'Индексы для рейтинга, достижений и журнала активности', _migration_performance_indexes),
+    (6, 'Индексы журнала активности для keyset-пагинации', _migration_activity_log_indexes),
+    (7, 'Таблица прогресса миграций данных', _migration_checkpoint_table),
+    (8, 'Индекс журнала активности по имени старого пилота', _migration_activity_log_pilot_index),
+    (9, 'Индексы порядка списка участников', _migration_member_order_indexes),
+]
+
+def get_schema_version():
+    """Текущая версия схемы (0, если таблицы schema_version еще нет)"""
     try:
-        db.session.execute(db.text("SELECT is_active FROM participant LIMIT 1"))
-        print("Колонка participant.is_active уже существует")
+        return db.session.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
     except Exception:
-        print("Добавляем колонку is_active в таблицу participant...")
+        db.session.rollback()
+        return 0
+
+def migrate_database():
+    """Обновляет схему базы данных: применяет только еще не примененные шаги миграций"""
+    current = get_schema_version()
+    latest = MIGRATIONS[-1][0]
+    if current >= latest:
+        return
+    
+    print(f"Обновляем схему базы данных с версии {current} до {latest}...")
+    
+    # Создаем все таблицы (для новой базы - сразу с актуальными колонками и индексами)
+    db.create_all()
+    
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
         try:
-            db.session.execute(db.text("ALTER TABLE participant ADD COLUMN is_active BOOLEAN DEFAULT 1"))
+            step()
+            db.session.add(SchemaVersion(version=version, description=description))
             db.session.commit()
-            print("Колонка participant.is_active успешно добавлена")
+            print(f"Миграция {version} применена: {description}")
+        except IntegrityError:
+            # Шаг параллельно применил другой процесс
+            db.session.rollback()
         except Exception as e:
-            print(f"Ошибка при добавлении колонки participant.is_active: {e}")
             db.session.rollback()
+            print(f"Ошибка при применении миграции {version} ({description}): {e}")
+            raise
+
+def migrate_pilots_to_participants(chunk_size=500):
+    """Мигрирует существующих пилотов в новую систему участников.
 
-def migrate_pilots_to_participants():
-    """Мигрирует существующих пилотов в новую систему участников"""
+    Пилоты и их достижения переносятся пачками по chunk_size через INSERT ... SELECT,
+    каждая пачка - отдельная транзакция вместе с отметкой прогресса в migration_checkpoint,
+    поэтому прерванная миграция продолжается с места остановки. Если после отметки
+    пилотов нет, функция завершается сразу.
+    """
     print("Начинаем миграцию пилотов в участников...")
     
     # Сначала обновляем схему базы данных
     migrate_database()
     
-    # Проверяем, существует ли таблица pilot
-    try:
-        pilots_data = db.session.execute(db.text("""
-            SELECT id, pilot_id, callsign, photo_url, category, join_date, points, qr_code 
-            FROM pilot
-        """)).fetchall()
-    except Exception:
-        print("Таблица pilot не существует или пуста, пропускаем миграцию")
-        return
+    checkpoint = db.session.get(MigrationCheckpoint, PILOT_MIGRATION_CHECKPOINT)
+    last_id = checkpoint.last_id if checkpoint else 0
+    has_pending = db.session.execute(
+        db.select(Pilot.id).where(Pilot.id > last_id).limit(1)
+    ).first() is not None
+    if not has_pending:
+        print("Нет пилотов для миграции")
+        return 0
     
-    migrated_count = 0
+    # Пилот уже мигрирован, если есть участник с тем же qr_code; конфликт - если занят его ID или позывной
+    already_migrated = db.select(Participant.id).where(Participant.qr_code == Pilot.qr_code).exists()
+    conflicting = db.select(Participant.id).where(
+        db.or_(Participant.participant_id == Pilot.pilot_id, Participant.callsign == Pilot.callsign)
+    ).exists()
     
-    for pilot_row in pilots_data:
-        # Проверяем, не мигрирован ли уже этот пилот
-        existing_participant = Participant.query.filter_by(qr_code=pilot_row.qr_code).first()
-        if existing_participant:
-            print(f"Пилот {pilot_row.callsign} уже мигрирован, пропускаем")
-            continue
-        
-        # Определяем подкатегорию на основе старой категории
-        if pilot_row.category == 'strike':
-            subcategory = 'pilot_strike'
-        elif pilot_row.category == 'reconnaissance':
-            subcategory = 'pilot_reconnaissance'
-        else:
-            print(f"Неизвестная категория пилота {pilot_row.callsign}: {pilot_row.category}")
-            continue
-        
-        # Преобразуем дату из строки в datetime объект если нужно
-        join_date = pilot_row.join_date
-        if isinstance(join_date, str):
-            from datetime import datetime
-            try:
-                join_date = datetime.fromisoformat(join_date.replace('Z', '+00:00'))
-            except:
-                join_date = datetime.now()
-        
-        # Создаем нового участника
-        participant = Participant(
-            participant_id=pilot_row.pilot_id,
-            callsign=pilot_row.callsign,
-            photo_url=pilot_row.photo_url,
-            category='military',  # Все пилоты попадают в военную категорию
-            subcategory=subcategory,
-            join_date=join_date,
-            points=pilot_row.points,
-            qr_code=pilot_row.qr_code
-        )
-        
-        db.session.add(participant)
-        db.session.flush()  # Получаем ID нового участника
+    migrated_count = 0
+    while True:
+        chunk = db.session.execute(
+            db.select(Pilot.id, Pilot.callsign, Pilot.category,
+                      already_migrated.label('already_migrated'), conflicting.label('conflicting'))
+            .where(Pilot.id > last_id)
+            .order_by(Pilot.id)
+            .limit(chunk_size)
+        ).all()
+        if not chunk:
+            break
         
-        # Мигрируем достижения через прямой SQL
-        achievements_data = db.session.execute(db.text("""
-            SELECT id, description, points, date_awarded 
-            FROM achievement 
-            WHERE pilot_id = :pilot_id
-        """), {"pilot_id": pilot_row.id}).fetchall()
+        eligible = []
+        for pilot_row in chunk:
+            if pilot_row.already_migrated:
+                continue
+            if pilot_row.category not in ('strike', 'reconnaissance'):
+                print(f"Неизвестная категория пилота {pilot_row.callsign}: {pilot_row.category}")
+            elif pilot_row.conflicting:
+                print(f"ID или позывной пилота {pilot_row.callsign} уже занят участником, пропускаем")
+            else:
+                eligible.append(pilot_row.id)
         
-        for achievement_row in achievements_data:
-            # Преобразуем дату достижения если нужно
-            date_awarded = achievement_row.date_awarded
-            if isinstance(date_awarded, str):
-                try:
-                    date_awarded = datetime.fromisoformat(date_awarded.replace('Z', '+00:00'))
-                except:
-                    date_awarded = datetime.now()
-            
-            new_achievement = Achievement(
-                participant_id=participant.id,
-                description=achievement_row.description,
-                points=achievement_row.points,
-                date_awarded=date_awarded
+        if eligible:
+            # Все пилоты попадают в военную категорию
+            subcategory = db.case((Pilot.category == 'strike', 'pilot_strike'), else_='pilot_reconnaissance')
+            db.session.execute(db.insert(Participant).from_select(
+                ['participant_id', 'callsign', 'photo_url', 'category', 'subcategory',
+                 'join_date', 'points', 'qr_code', 'is_active'],
+                db.select(Pilot.pilot_id, Pilot.callsign, Pilot.photo_url, db.literal('military'), subcategory,
+                          db.func.coalesce(Pilot.join_date, datetime.now()), db.func.coalesce(Pilot.points, 0),
+                          Pilot.qr_code, db.true())
+                .where(Pilot.id.in_(eligible))
+            ))
+            db.session.execute(db.insert(Achievement).from_select(
+                ['participant_id', 'description', 'points', 'date_awarded'],
+                db.select(Participant.id, Achievement.description, Achievement.points, Achievement.date_awarded)
+                .join(Pilot, Achievement.pilot_id == Pilot.id)
+                .join(Participant, Participant.participant_id == Pilot.pilot_id)
+                .where(Pilot.id.in_(eligible))
+            ))
+            log_admin_activity(
+                action_type='migrate_pilots',
+                description=f'Мігровано {len(eligible)} пілотів в учасники'
             )
-            db.session.add(new_achievement)
+            bump_data_version()
+        
+        last_id = chunk[-1].id
+        if checkpoint is None:
+            checkpoint = MigrationCheckpoint(name=PILOT_MIGRATION_CHECKPOINT)
+            db.session.add(checkpoint)
+        checkpoint.last_id = last_id
+        db.session.commit()
         
-        migrated_count += 1
-        print(f"Мигрирован пилот: {pilot_row.callsign} -> {participant.category}/{participant.subcategory}")
+        migrated_count += len(eligible)
+        print(f"Обработаны пилоты до id={last_id}: мигрировано {len(eligible)} из {len(chunk)}")
     
     if migrated_count > 0:
-        db.session.commit()
         print(f"Миграция завершена! Мигрировано {migrated_count} пилотов")
     else:
         print("Нет пилотов для миграции")
+    return migrated_count
 
-if __name__ == '__main__':
-    # Создаем необходимые директории
-    os.makedirs('/tmp', exist_ok=True)
-    os.makedirs('static/qr_codes', exist_ok=True)
+@app.cli.command('migrate-pilots')
+@click.option('--chunk-size', type=int, default=500, show_default=True, help='Количество пилотов в одной транзакции.')
+def migrate_pilots_command(chunk_size):
+    """Переносит старых пилотов и их достижения в участников (можно прерывать и запускать повторно)."""
+    migrate_pilots_to_participants(chunk_size)
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Обновляет схему базы данных и переносит старых пилотов. Выполняется один раз при деплое, а не при старте воркеров."""
+    migrate_database()
+    migrate_pilots_to_participants()
+
+def seed_demo_participants():
+    """Создает шесть тестовых участников с QR-кодами, если в базе еще нет ни участников, ни пилотов"""
+    if Pilot.query.count() > 0 or Participant.query.count() > 0:
+        return False
+    
+    test_participants = [
+        {
+            'participant_id': 'UAV-0001',
+            'callsign': 'Орел',
+            'category': 'military',
+            'subcategory': 'pilot_strike',
+            'photo_url': 'default-pilot.svg',
+            'points': 1250,
+            'qr_code': str(uuid.uuid4())
+        },
+        {
+            'participant_id': 'UAV-0002',
+            'callsign': 'Сокол',
+            'category': 'military',
+            'subcategory': 'pilot_reconnaissance',
+            'photo_url': 'default-pilot.svg',
+            'points': 980,
+            'qr_code': str(uuid.uuid4())
+        },
+        {
+            'participant_id': 'UAV-0003',
+            'callsign': 'Беркут',
+            'category': 'military',
+            'subcategory': 'pilot_strike',
+            'photo_url': 'default-pilot.svg',
+            'points': 1400,
+            'qr_code': str(uuid.uuid4())
+        },
+        {
+            'participant_id': 'UAV-0004',
+            'callsign': 'Ястреб',
+            'category': 'military',
+            'subcategory': 'pilot_reconnaissance',
+            'photo_url': 'default-pilot.svg',
+            'points': 1120,
+            'qr_code': str(uuid.uuid4())
+        },
+        {
+            'participant_id': 'UAV-0005',
+            'callsign': 'Інженер-01',
+            'category': 'deftech',
+            'subcategory': 'developer',
+            'photo_url': 'default-pilot.svg',
+            'points': 850,
+            'qr_code': str(uuid.uuid4())
+        },
+        {
+            'participant_id': 'UAV-0006',
+            'callsign': 'Цивіл-01',
+            'category': 'civil',
+            'subcategory': 'instructor',
+            'photo_url': 'default-pilot.svg',
+            'points': 650,
+            'qr_code': str(uuid.uuid4())
+        }
+    ]
     
-    with app.app_context():
-        db.create_all()
-        
-        # Выполняем миграцию существующих пилотов
-        migrate_pilots_to_participants()
-        
-        # Создаем тестовых участников, если их нет
-        if Pilot.query.count() == 0 and Participant.query.count() == 0:
-            test_participants = [
-                {
-                    'participant_id': 'UAV-0001',
-                    'callsign': 'Орел',
-                    'category': 'military',
-                    'subcategory': 'pilot_strike',
-                    'photo_url': 'default-pilot.svg',
-                    'points': 1250,
-                    'qr_code': str(uuid.uuid4())
-                },
-                {
-                    'participant_id': 'UAV-0002',
-                    'callsign': 'Сокол',
-                    'category': 'military',
-                    'subcategory': 'pilot_reconnaissance',
-                    'photo_url': 'default-pilot.svg',
-                    'points': 980,
-                    'qr_code': str(uuid.uuid4())
-                },
-                {
-                    'participant_id': 'UAV-0003',
-                    'callsign': 'Беркут',
-                    'category': 'military',
-                    'subcategory': 'pilot_strike',
-                    'photo_url': 'default-pilot.svg',
-                    'points': 1400,
-                    'qr_code': str(uuid.uuid4())
-                },
-                {
-                    'participant_id': 'UAV-0004',
-                    'callsign': 'Ястреб',
-                    'category': 'military',
-                    'subcategory': 'pilot_reconnaissance',
-                    'photo_url': 'default-pilot.svg',
-                    'points': 1120,
-                    'qr_code': str(uuid.uuid4())
-                },
-                {
-                    'participant_id': 'UAV-0005',
-                    'callsign': 'Інженер-01',
-                    'category': 'deftech',
-                    'subcategory': 'developer',
-                    'photo_url': 'default-pilot.svg',
-                    'points': 850,
-                    'qr_code': str(uuid.uuid4())
-                },
-                {
-                    'participant_id': 'UAV-0006',
-                    'callsign': 'Цивіл-01',
-                    'category': 'civil',
-                    'subcategory': 'instructor',
-                    'photo_url': 'default-pilot.svg',
-                    'points': 650,
-                    'qr_code': str(uuid.uuid4())
-                }
-            ]
-            
-            for participant_data in test_participants:
-                participant = Participant(**participant_data)
-                db.session.add(participant)
-            
-            db.session.commit()
-            
-            # Создаем QR коды для всех тестовых участников
-            for participant in Participant.query.all():
-                save_participant_qr_code(participant)
-            
-            print("Тестовые участники созданы с QR кодами")
+    for participant_data in test_participants:
+        participant = Participant(**participant_data)
+        db.session.add(participant)
+    
+    # Тестовые ID назначены вручную - сдвигаем счетчик автогенерации
+    advance_participant_id_counter(max(parse_participant_number(p['participant_id']) for p in test_participants))
+    bump_data_version()
+    db.session.commit()
     
+    # Создаем QR коды для всех тестовых участников
+    for participant in Participant.query.all():
+        save_participant_qr_code(participant)
+    return True
+
+@app.cli.command('seed-demo')
+def seed_demo_command():
+    """Заполняет пустую базу тестовыми участниками (для локальной разработки)."""
+    if seed_demo_participants():
+        click.echo("Тестовые участники созданы с QR кодами")
+    else:
+        click.echo("База уже содержит участников - тестовые данные не созданы")
+
+if __name__ == '__main__':
+    # Схема и тестовые данные: flask --app 'app:create_app()' db-upgrade && flask --app 'app:create_app()' seed-demo
+    create_app()
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,28 @@
+"""Бенчмарки: синтетические данные федерации и замеры ключевых маршрутов.
+
+Типичный сценарий сравнения двух коммитов:
+
+    python -m benchmarks.seed --database-url sqlite:////tmp/bench.db --members 100000 --reset
+    python -m benchmarks.run --database-url sqlite:////tmp/bench.db
+    git checkout <другой коммит>
+    python -m benchmarks.run --database-url sqlite:////tmp/bench.db
+    python -m benchmarks.compare benchmarks/results/<старый>.json benchmarks/results/<новый>.json
+
+Для PostgreSQL достаточно передать --database-url postgresql://... в seed и run.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+
+def load_app(database_url, **environ):
+    """Импортирует app.py с заданной базой и подключает ее через create_app. Конфигурация читается при импорте, поэтому окружение задается до него."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.update(environ)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import app
+    app.create_app()
+    return app
@@ -0,0 +1,63 @@
+"""Сравнение двух результатов benchmarks.run.
+
+    python -m benchmarks.compare benchmarks/results/a1b2c3d-sqlite-100000-client.json \\
+                                 benchmarks/results/e4f5a6b-sqlite-100000-client.json --fail-on-regression
+
+Регрессия - рост метрики больше чем на --threshold процентов (и число запросов, выросшее хотя бы на один).
+"""
+import json
+
+import click
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'peak_rss_mb')
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, threshold):
+    """Строки (сценарий, метрика, было, стало, изменение в %, регрессия ли)"""
+    rows = []
+    for name, before in baseline['scenarios'].items():
+        after = candidate['scenarios'].get(name)
+        if after is None:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else float('inf'))
+            if metric == 'queries_per_request':
+                regression = new - old >= 1
+            else:
+                regression = change > threshold
+            rows.append((name, metric, old, new, change, regression))
+    return rows
+
+
+@click.command()
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('candidate', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', type=float, default=10.0, show_default=True, help='Допустимый рост метрики, %.')
+@click.option('--fail-on-regression', is_flag=True, help='Завершиться с кодом 1 при регрессии (для CI).')
+def main(baseline, candidate, threshold, fail_on_regression):
+    """Показывает изменение метрик между двумя прогонами бенчмарка."""
+    baseline, candidate = _load(baseline), _load(candidate)
+    for key in ('database', 'members', 'server'):
+        if baseline['meta'].get(key) != candidate['meta'].get(key):
+            click.echo(f"Внимание: различается {key}: {baseline['meta'].get(key)} и {candidate['meta'].get(key)}", err=True)
+
+    click.echo(f"{baseline['meta']['commit']} -> {candidate['meta']['commit']}")
+    rows = compare(baseline, candidate, threshold)
+    for name, metric, old, new, change, regression in rows:
+        marker = '  РЕГРЕССИЯ' if regression else ''
+        click.echo(f"{name:<30} {metric:<20} {old:>10} -> {new:>10} ({change:+.1f}%){marker}")
+
+    if fail_on_regression and any(row[-1] for row in rows):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""Замер ключевых маршрутов на заполненной базе (см. benchmarks.seed).
+
+    python -m benchmarks.run --database-url sqlite:////tmp/bench.db
+    python -m benchmarks.run --database-url postgresql://localhost/bench --server gunicorn --workers 2
+
+По умолчанию запросы идут через тестовый клиент Flask в этом процессе. С --server gunicorn
+поднимается локальный gunicorn с SQL_PROFILE=1, число запросов берется из заголовка X-Query-Count,
+а пиковая память - из VmHWM процессов-воркеров. Результат пишется в JSON (по умолчанию
+benchmarks/results/<коммит>-<база>-<участников>.json) для сравнения через benchmarks.compare.
+"""
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import event
+
+from benchmarks import REPO_ROOT, RESULTS_DIR, load_app
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return None
+    index = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(latencies, queries, peak_rss):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1) if peak_rss else None,
+    }
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    return git('rev-parse', '--short', 'HEAD') or 'unknown', bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def sample_qr_codes(A, size, rng):
+    """Случайная выборка qr_code участников и немигрированных пилотов (reservoir sampling за один проход)"""
+    codes, total = [], 0
+    with A.app.app_context():
+        statement = A.db.select(A.member_table.c.qr_code).order_by(A.member_table.c.kind, A.member_table.c.id)
+        for qr_code in A.db.session.execute(statement.execution_options(yield_per=5000)).scalars():
+            total += 1
+            if len(codes) < size:
+                codes.append(qr_code)
+            else:
+                index = rng.randrange(total)
+                if index < size:
+                    codes[index] = qr_code
+    rng.shuffle(codes)
+    return codes, total
+
+
+def http_scenarios(A, qr_codes):
+    """(имя, подготовка(путь) или None, следующий путь, нужен ли вход администратора) для маршрутов"""
+    def reset_leaderboard(path):
+        A.data_version_cache.invalidate()
+        A.leaderboard_cache.invalidate()
+
+    def reset_dashboard(path):
+        A.dashboard_stats_cache.invalidate()
+
+    def reset_qr(path):
+        A.qr_png_cache.pop(path.rsplit('/', 1)[1])
+
+    codes = iter(qr_codes * 1000)
+    return [
+        ('rating', None, lambda: '/rating', False),
+        ('rating_cold', reset_leaderboard, lambda: '/rating', False),
+        ('pilot_profile', None, lambda: f"/pilot/{next(codes)}", False),
+        ('admin_dashboard', reset_dashboard, lambda: '/admin', True),
+        ('generate_qr', reset_qr, lambda: f"/qr/{next(codes)}", False),
+    ]
+
+
+class QueryCounter:
+    def __init__(self, A):
+        self.count = 0
+        with A.app.app_context():
+            event.listen(A.db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def run_in_process(A, qr_codes, requests, warmup):
+    """Запросы через тестовый клиент Flask; память - пик процесса бенчмарка"""
+    counter = QueryCounter(A)
+    client = A.app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+
+    results = {}
+    for name, prepare, path, _ in http_scenarios(A, qr_codes):
+        latencies, queries = [], []
+        for iteration in range(warmup + requests):
+            target = path()
+            if prepare is not None:
+                prepare(target)
+            counter.count = 0
+            started = time.perf_counter()
+            response = client.get(target)
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise click.ClickException(f"{name}: {target} вернул {response.status_code}")
+            if iteration >= warmup:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+        results[name] = summarize(latencies, queries, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+        click.echo(f"{name}: p50 {results[name]['p50_ms']} мс, p95 {results[name]['p95_ms']} мс, "
+                   f"{results[name]['queries_per_request']} запросов")
+
+    # Выделение ID - функция без HTTP-маршрута, замеряется напрямую
+    latencies, queries = [], []
+    with A.app.app_context():
+        for iteration in range(warmup + requests):
+            counter.count = 0
+            started = time.perf_counter()
+            A.generate_next_participant_id()
+            A.db.session.commit()
+            elapsed = time.perf_counter() - started
+            if iteration >= warmup:
+                latencies.append(elapsed)
+                queries.append(counter.count)
+    results['generate_next_participant_id'] = summarize(latencies, queries,
+                                                        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _worker_peak_rss(master_pid):
+    """Максимальный VmHWM среди воркеров gunicorn (Linux /proc)"""
+    peak = 0
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            children = f.read().split()
+    except OSError:
+        return None
+    for pid in children:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak, int(line.split()[1]) * 1024)
+        except OSError:
+            continue
+    return peak or None
+
+
+def run_gunicorn(A, database_url, qr_codes, requests, warmup, workers, workdir):
+    """Запросы к локальному gunicorn по HTTP/1.1 keep-alive"""
+    port = _free_port()
+    environ = dict(os.environ, DATABASE_URL=database_url, SQL_PROFILE='1', FLASK_ENV='production')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--worker-class', 'gthread', '--threads', '4', '--workers', str(workers),
+         '--preload', '--bind', f"127.0.0.1:{port}", '--pythonpath', REPO_ROOT, 'app:create_app(precompile_templates=True)'],
+        cwd=workdir, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        for _ in range(100):
+            try:
+                connection.request('GET', '/support')
+                connection.getresponse().read()
+                break
+            except OSError:
+                connection.close()
+                time.sleep(0.2)
+        else:
+            raise click.ClickException('gunicorn не запустился')
+
+        connection.request('POST', '/admin/login', body='username={}&password={}'.format(
+            os.environ.get('ADMIN_USERNAME', 'admin13'), os.environ.get('ADMIN_PASSWORD', 'admin1313')),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        login = connection.getresponse()
+        login.read()
+        cookie = (login.getheader('Set-Cookie') or '').split(';', 1)[0]
+
+        results = {}
+        for name, _, path, needs_admin in http_scenarios(A, qr_codes):
+            # Кэши воркеров отсюда не сбросить: замеряется установившийся режим, холодный рейтинг пропускается
+            if name == 'rating_cold':
+                continue
+            latencies, queries = [], []
+            for iteration in range(warmup + requests):
+                target = path()
+                started = time.perf_counter()
+                connection.request('GET', target, headers={'Cookie': cookie} if needs_admin else {})
+                response = connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                if response.status != 200:
+                    raise click.ClickException(f"{name}: {target} вернул {response.status}")
+                if iteration >= warmup:
+                    latencies.append(elapsed)
+                    queries.append(int(response.getheader('X-Query-Count', 0)))
+            results[name] = summarize(latencies, queries, _worker_peak_rss(server.pid))
+            click.echo(f"{name}: p50 {results[name]['p50_ms']} мс, p95 {results[name]['p95_ms']} мс, "
+                       f"{results[name]['queries_per_request']} запросов")
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+@click.command()
+@click.option('--database-url', required=True, help='URL заполненной базы.')
+@click.option('--requests', type=int, default=200, show_default=True, help='Замеряемых запросов на сценарий.')
+@click.option('--warmup', type=int, default=10, show_default=True, help='Запросов прогрева (не учитываются).')
+@click.option('--server', type=click.Choice(['client', 'gunicorn']), default='client', show_default=True)
+@click.option('--workers', type=int, default=2, show_default=True, help='Воркеров gunicorn.')
+@click.option('--seed', 'seed_value', type=int, default=1, show_default=True, help='Зерно выборки участников.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None, help='Файл результата JSON.')
+def main(database_url, requests, warmup, server, workers, seed_value, output):
+    """Замеряет латентность, число SQL-запросов и пиковую память ключевых маршрутов."""
+    output = os.path.abspath(output) if output else None
+    A = load_app(database_url)
+    qr_codes, members = sample_qr_codes(A, 1000, random.Random(seed_value))
+    commit, dirty = git_revision()
+
+    # QR-файлы и прочие относительные пути приложения - во временном каталоге, а не в репозитории
+    with tempfile.TemporaryDirectory(prefix='ufmup-bench-') as workdir:
+        os.chdir(workdir)
+        try:
+            if server == 'client':
+                scenarios = run_in_process(A, qr_codes, requests, warmup)
+            else:
+                scenarios = run_gunicorn(A, database_url, qr_codes, requests, warmup, workers, workdir)
+        finally:
+            os.chdir(REPO_ROOT)
+
+    with A.app.app_context():
+        dialect = A.db.engine.dialect.name
+    result = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': dialect,
+            'members': members,
+            'server': server,
+            'workers': workers if server == 'gunicorn' else None,
+            'requests': requests,
+        },
+        'scenarios': scenarios,
+    }
+    output = output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}-{dialect}-{members}-{server}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    click.echo(f"Результат записан в {output}")
+
+
+if __name__ == '__main__':
+    main()
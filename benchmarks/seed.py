@@ -0,0 +1,219 @@
+"""Быстрое заполнение базы синтетическими участниками, старыми пилотами, достижениями и журналом активности.
+
+    python -m benchmarks.seed --database-url sqlite:////tmp/bench.db --members 100000 --reset
+
+Данные детерминированы параметром --seed. Строки вставляются пачками через executemany,
+первичные ключи назначаются заранее, поэтому достижения и журнал ссылаются на участников без
+дополнительных запросов.
+"""
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import click
+
+from benchmarks import load_app
+
+# Доли категорий и подкатегорий: большинство - военные пилоты, команда федерации - единицы
+CATEGORY_WEIGHTS = {
+    'military': 55,
+    'civil': 20,
+    'deftech': 10,
+    'donor_partner': 10,
+    'media_education': 5,
+}
+SUBCATEGORY_WEIGHTS = {
+    'pilot_strike': 30,
+    'pilot_reconnaissance': 30,
+    'pilot_interceptor': 10,
+    'pilot': 40,
+    'federation_team': 1,
+}
+DEFAULT_SUBCATEGORY_WEIGHT = 10
+
+CALLSIGN_WORDS = ('Орел', 'Сокіл', 'Беркут', 'Яструб', 'Грім', 'Тінь', 'Вітер', 'Шершень',
+                  'Фенікс', 'Вовк', 'Лис', 'Кобра', 'Бурлака', 'Козак', 'Чорт', 'Мольфар')
+ACHIEVEMENT_DESCRIPTIONS = ('Успішне виконання бойового завдання', 'Знищення техніки противника',
+                            'Розвідка позицій', 'Навчання нових пілотів', 'Перемога у змаганнях',
+                            'Підтримка федерації', 'Розробка нового обладнання')
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _pick_category(rng, categories):
+    category = rng.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()))[0]
+    subcategories = list(categories[category]['subcategories'])
+    weights = [SUBCATEGORY_WEIGHTS.get(key, DEFAULT_SUBCATEGORY_WEIGHT) for key in subcategories]
+    return category, rng.choices(subcategories, weights=weights)[0]
+
+
+def _achievements(rng, mean, is_pilot, since, now):
+    """Список (описание, очки, дата) - у пилотов достижений больше и они весомее"""
+    count = int(rng.expovariate(1 / (mean * 2 if is_pilot else mean / 2))) if mean else 0
+    span = max((now - since).total_seconds(), 1)
+    return [
+        (rng.choice(ACHIEVEMENT_DESCRIPTIONS),
+         rng.choice((10, 25, 50, 100, 250)) * (2 if is_pilot else 1),
+         since + timedelta(seconds=rng.uniform(0, span)))
+        for _ in range(count)
+    ]
+
+
+class BatchWriter:
+    """Копит строки по таблицам и вставляет их пачками через executemany.
+
+    Сбрасываются сразу все таблицы в порядке первого добавления, поэтому строки-владельцы
+    всегда попадают в базу раньше ссылающихся на них достижений и записей журнала.
+    """
+
+    def __init__(self, db, batch_size):
+        self.db = db
+        self.batch_size = batch_size
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        rows = self.pending.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for model in list(self.pending):
+            rows = self.pending.pop(model)
+            self.db.session.execute(self.db.insert(model), rows)
+            self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + len(rows)
+
+
+def reset_database(app_module):
+    """Удаляет все таблицы приложения, поисковый индекс и последовательность ID"""
+    db = app_module.db
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        db.session.execute(db.text("DROP TABLE IF EXISTS member_search"))
+    db.session.commit()
+    db.drop_all()
+    if dialect == 'postgresql':
+        db.session.execute(db.text(f"DROP SEQUENCE IF EXISTS {app_module.PARTICIPANT_ID_SEQUENCE}"))
+        db.session.commit()
+
+
+def seed(app_module, members, pilots, achievements_mean, batch_size=5000, seed_value=1):
+    """Заполняет пустую базу и возвращает количество вставленных строк по таблицам"""
+    A = app_module
+    db = A.db
+    rng = random.Random(seed_value)
+    now = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    writer = BatchWriter(db, batch_size)
+    achievement_id = log_id = 0
+
+    def add_history(owner, name, join_date, awards, action_type, description):
+        """Запись о добавлении, достижения и записи журнала о них. owner - {'participant_id': id} или {'pilot_id': id}."""
+        nonlocal achievement_id, log_id
+        name_key = 'participant_name' if 'participant_id' in owner else 'pilot_name'
+        log_id += 1
+        writer.add(A.AdminActivityLog, {
+            'id': log_id, 'action_type': action_type, **owner, name_key: name,
+            'description': description, 'points_awarded': None, 'timestamp': join_date,
+        })
+        for award_description, points, awarded_at in awards:
+            achievement_id += 1
+            log_id += 1
+            writer.add(A.Achievement, {
+                'id': achievement_id, **owner, 'description': award_description,
+                'points': points, 'date_awarded': awarded_at,
+            })
+            writer.add(A.AdminActivityLog, {
+                'id': log_id, 'action_type': 'add_achievement', **owner, name_key: name,
+                'description': f"Нараховано {points} очок учаснику {name}: {award_description}",
+                'points_awarded': points, 'timestamp': awarded_at,
+            })
+
+    for number in range(1, members + 1):
+        category, subcategory = _pick_category(rng, A.CATEGORIES)
+        callsign = f"{rng.choice(CALLSIGN_WORDS)}-{number}"
+        join_date = now - timedelta(days=rng.uniform(0, 3 * 365))
+        awards = _achievements(rng, achievements_mean, A.is_pilot_subcategory(category, subcategory), join_date, now)
+        writer.add(A.Participant, {
+            'id': number,
+            'participant_id': A.format_participant_id(number),
+            'callsign': callsign,
+            'category': category,
+            'subcategory': subcategory,
+            'photo_url': 'default-pilot.svg',
+            'join_date': join_date,
+            'points': sum(points for _, points, _ in awards),
+            'qr_code': _uuid(rng),
+            'is_active': rng.random() < 0.95,
+        })
+        add_history({'participant_id': number}, callsign, join_date, awards, 'add_participant',
+                    f"Додано нового учасника {callsign} в категорії {category}")
+
+    # Строки участников и пилотов имеют разный набор колонок - пачки не смешиваем.
+    # Старые пилоты получают номера после участников, чтобы ID не пересекались.
+    writer.flush()
+    for number in range(1, pilots + 1):
+        callsign = f"{rng.choice(CALLSIGN_WORDS)}-П{number}"
+        join_date = now - timedelta(days=rng.uniform(365, 4 * 365))
+        awards = _achievements(rng, achievements_mean, True, join_date, now)
+        writer.add(A.Pilot, {
+            'id': number,
+            'pilot_id': A.format_participant_id(members + number),
+            'callsign': callsign,
+            'photo_url': 'default-pilot.svg',
+            'category': rng.choice(('strike', 'reconnaissance')),
+            'join_date': join_date,
+            'points': sum(points for _, points, _ in awards),
+            'qr_code': _uuid(rng),
+        })
+        add_history({'pilot_id': number}, callsign, join_date, awards, 'add_pilot',
+                    f"Додано пілота {callsign}")
+
+    writer.flush()
+
+    A.advance_participant_id_counter(members + pilots)
+    if db.engine.dialect.name == 'postgresql':
+        # Ключи назначены явно - подтягиваем serial-последовательности
+        for table in ('participant', 'pilot', 'achievement', 'admin_activity_log'):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST((SELECT MAX(id) FROM {table}), 1))"))
+    A.bump_data_version()
+    db.session.commit()
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+    return writer.counts
+
+
+@click.command()
+@click.option('--database-url', required=True, help='URL базы (sqlite:////tmp/bench.db или postgresql://...).')
+@click.option('--members', type=int, default=10000, show_default=True, help='Количество участников.')
+@click.option('--pilots', type=int, default=None, help='Количество старых пилотов (по умолчанию 1% от участников).')
+@click.option('--achievements', type=float, default=3.0, show_default=True, help='Среднее количество достижений на участника.')
+@click.option('--batch-size', type=int, default=5000, show_default=True, help='Размер пачки вставки.')
+@click.option('--seed', 'seed_value', type=int, default=1, show_default=True, help='Зерно генератора случайных чисел.')
+@click.option('--reset', is_flag=True, help='Удалить существующие данные перед заполнением.')
+def main(database_url, members, pilots, achievements, batch_size, seed_value, reset):
+    """Заполняет базу синтетическими данными федерации."""
+    A = load_app(database_url)
+    pilots = members // 100 if pilots is None else pilots
+
+    with A.app.app_context():
+        if reset:
+            reset_database(A)
+        A.migrate_database()
+        if A.db.session.execute(A.db.select(A.member_table.c.id).limit(1)).first() is not None:
+            raise click.UsageError('База уже содержит участников - используйте --reset')
+
+        started = time.monotonic()
+        counts = seed(A, members, pilots, achievements, batch_size, seed_value)
+        elapsed = time.monotonic() - started
+
+    summary = ', '.join(f"{table}: {count}" for table, count in sorted(counts.items()))
+    click.echo(f"Готово за {elapsed:.1f} с ({summary})")
+
+
+if __name__ == '__main__':
+    main()
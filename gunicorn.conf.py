@@ -0,0 +1,13 @@
+# Настройки gunicorn (подхватываются автоматически из рабочего каталога, см. Procfile)
+
+
+def on_starting(server):
+    # Снимки метрик прошлого запуска не должны попадать в /metrics нового
+    from app import metrics
+    metrics.clear_snapshots()
+
+
+def child_exit(server, worker):
+    # Счетчики завершившегося воркера убираем из /metrics; новый воркер с тем же pid начнет с нуля
+    from app import metrics
+    metrics.remove_snapshot(worker.pid)
@@ -0,0 +1,106 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from app import db  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def database_path(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('db') / 'test.db')
+
+
+@pytest.fixture(scope='session')
+def flask_app(database_path):
+    # Реплика - тот же файл через отдельный engine: данные одни, а маршрутизацию видно по engine
+    return app_module.create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}',
+        'DATABASE_REPLICA_URL': f'sqlite:///{database_path}',
+        'DATA_VERSION_CHECK_INTERVAL': 0,
+        'JINJA_BYTECODE_CACHE_DIR': '',
+        'RENDERED_PAGE_CACHE_DIR': '',
+        'METRICS_DIR': '',
+        'SQL_PROFILE': False,
+    })
+
+
+@pytest.fixture(autouse=True)
+def database(flask_app, database_path, tmp_path, monkeypatch):
+    """Чистая база со всеми миграциями и чистые кэши процесса для каждого теста"""
+    # QR-коды пишутся в static/qr_codes относительно рабочего каталога
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app_module, 'PHOTO_UPLOAD_DIR', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(app_module, 'data_version_cache', app_module.DataVersionCache())
+    monkeypatch.setattr(app_module, 'leaderboard_cache', app_module.LeaderboardCache())
+    monkeypatch.setattr(app_module, 'dashboard_stats_cache', app_module.TimedCache('DASHBOARD_STATS_TTL'))
+    monkeypatch.setattr(app_module, 'rendered_page_cache',
+                        app_module.RenderedPageCache(app_module.LRUCache('RENDERED_PAGE_CACHE_SIZE')))
+    monkeypatch.setattr(app_module, 'qr_png_cache', app_module.LRUCache('QR_CACHE_SIZE'))
+    monkeypatch.setattr(app_module, 'replica_lag_monitor', app_module.ReplicaLagMonitor())
+    monkeypatch.setattr(app_module, '_id_allocator_ready', False)
+    monkeypatch.setattr(app_module, '_search_backend', None)
+
+    with flask_app.app_context():
+        app_module.migrate_database()
+    yield
+
+    wait_for_background_tasks()
+    with flask_app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    os.remove(database_path)
+
+
+def wait_for_background_tasks():
+    if app_module._background_executor is not None:
+        app_module._background_executor.shutdown(wait=True)
+        app_module._background_executor = None
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def admin_client(flask_app):
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['admin'] = True
+    return client
+
+
+@pytest.fixture
+def make_participant(flask_app):
+    def make(callsign, category='military', subcategory='pilot_strike', points=0, **fields):
+        with flask_app.app_context():
+            number = app_module.allocate_participant_numbers()[0]
+            participant = app_module.Participant(
+                participant_id=app_module.format_participant_id(number), callsign=callsign,
+                category=category, subcategory=subcategory, points=points,
+                qr_code=str(uuid.uuid4()), **fields)
+            db.session.add(participant)
+            app_module.bump_data_version()
+            db.session.commit()
+            return participant.id, participant.participant_id, participant.qr_code
+    return make
+
+
+@pytest.fixture
+def make_pilot(flask_app):
+    def make(pilot_id, callsign, category='strike', points=0, **fields):
+        with flask_app.app_context():
+            pilot = app_module.Pilot(pilot_id=pilot_id, callsign=callsign, category=category, points=points,
+                                     qr_code=str(uuid.uuid4()), **fields)
+            db.session.add(pilot)
+            app_module.bump_data_version()
+            db.session.commit()
+            return pilot.id, pilot.qr_code
+    return make
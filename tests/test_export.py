@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+import pytest
+
+import app as app_module
+from app import db
+
+
+@pytest.fixture
+def members(flask_app, make_participant, make_pilot):
+    make_participant('Civ', category='civil', subcategory='pilot', join_date=datetime(2024, 1, 10))
+    make_participant('Mil', category='military', subcategory='instructor', join_date=datetime(2024, 3, 5))
+    strike_id, _ = make_pilot('PLT-1', 'Old-Strike', category='strike', join_date=datetime(2023, 6, 1))
+    make_pilot('PLT-2', 'Old-Recon', category='reconnaissance', join_date=datetime(2024, 2, 1))
+    with flask_app.app_context():
+        civ = app_module.Participant.query.filter_by(callsign='Civ').one()
+        db.session.add_all([
+            app_module.Achievement(participant_id=civ.id, description='Цивільне', points=1),
+            app_module.Achievement(pilot_id=strike_id, description='Архівне', points=2),
+        ])
+        db.session.commit()
+
+
+def export_rows(flask_app, dataset, **filters):
+    with flask_app.app_context():
+        return db.session.execute(app_module.build_export_query(dataset, **filters)).mappings().all()
+
+
+def test_participants_export_filters(flask_app, members):
+    assert [r['callsign'] for r in export_rows(flask_app, 'participants', category='civil')] == ['Civ']
+    assert [r['callsign'] for r in export_rows(flask_app, 'participants', date_from=date(2024, 2, 1))] == ['Mil']
+    assert [r['callsign'] for r in export_rows(flask_app, 'participants', date_to=date(2024, 1, 10))] == ['Civ']
+
+
+def test_legacy_pilots_export_as_military(flask_app, members):
+    rows = export_rows(flask_app, 'pilots', category='military')
+    assert [(r['callsign'], r['category'], r['subcategory']) for r in rows] == [
+        ('Old-Strike', 'military', 'pilot_strike'),
+        ('Old-Recon', 'military', 'pilot_reconnaissance'),
+    ]
+    assert export_rows(flask_app, 'pilots', category='civil') == []
+    assert export_rows(flask_app, 'pilots', category='strike') == []
+
+
+def test_achievements_export_uses_owner_category(flask_app, members):
+    assert [r['description'] for r in export_rows(flask_app, 'achievements', category='military')] == ['Архівне']
+    assert [r['description'] for r in export_rows(flask_app, 'achievements', category='civil')] == ['Цивільне']
+
+
+def test_unknown_dataset_is_rejected(flask_app):
+    with pytest.raises(ValueError):
+        app_module.build_export_query('secrets')
+
+
+def test_export_command_writes_csv_and_ndjson(flask_app, members):
+    runner = flask_app.test_cli_runner()
+
+    result = runner.invoke(args=['export', 'pilots', '--category', 'military'])
+    assert result.exit_code == 0, result.output
+    rows = list(csv.DictReader(io.StringIO(result.output)))
+    assert [(r['pilot_id'], r['category'], r['subcategory']) for r in rows] == [
+        ('PLT-1', 'military', 'pilot_strike'), ('PLT-2', 'military', 'pilot_reconnaissance'),
+    ]
+
+    result = runner.invoke(args=['export', 'participants', '--format', 'ndjson', '--date-from', '2024-02-01'])
+    assert result.exit_code == 0, result.output
+    assert [json.loads(line)['callsign'] for line in result.output.splitlines()] == ['Mil']
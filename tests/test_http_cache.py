@@ -0,0 +1,74 @@
+import os
+
+import app as app_module
+
+
+def test_qr_code_etag_and_not_modified(client, make_participant):
+    _, participant_id, qr_code = make_participant('Sokol')
+
+    response = client.get(f'/qr/{qr_code}')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+    assert os.path.exists(app_module.qr_file_path(participant_id))
+
+    response = client.get(f'/qr/{qr_code}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_unknown_qr_code_is_not_found(client):
+    assert client.get('/qr/missing').status_code == 404
+
+
+def test_deleted_member_qr_code_is_gone(client, admin_client, make_participant):
+    participant_id, member_id, qr_code = make_participant('Sokol')
+    etag = client.get(f'/qr/{qr_code}').headers['ETag']
+
+    assert admin_client.post(f'/admin/participant/{participant_id}/delete').status_code == 302
+
+    assert client.get(f'/qr/{qr_code}').status_code == 404
+    assert client.get(f'/qr/{qr_code}', headers={'If-None-Match': etag}).status_code == 404
+    assert not os.path.exists(app_module.qr_file_path(member_id))
+
+
+def test_member_deleted_by_another_worker_is_revalidated(flask_app, client, make_participant):
+    participant_id, _, qr_code = make_participant('Sokol')
+    etag = client.get(f'/qr/{qr_code}').headers['ETag']
+
+    # Другой воркер удалил участника: кэш PNG этого процесса о нем не знает
+    with flask_app.app_context():
+        app_module.db.session.execute(app_module.db.delete(app_module.Participant)
+                                      .where(app_module.Participant.id == participant_id))
+        app_module.bump_data_version()
+        app_module.db.session.commit()
+
+    assert client.get(f'/qr/{qr_code}', headers={'If-None-Match': etag}).status_code == 404
+
+
+def test_profile_etag_changes_after_write(client, admin_client, make_participant):
+    participant_id, _, qr_code = make_participant('Sokol')
+
+    response = client.get(f'/pilot/{qr_code}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert client.get(f'/pilot/{qr_code}', headers={'If-None-Match': etag}).status_code == 304
+
+    admin_client.post(f'/admin/participant/{participant_id}/add_achievement',
+                      data={'description': 'Перший політ', 'points': '5'})
+
+    response = client.get(f'/pilot/{qr_code}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert 'Перший політ' in response.get_data(as_text=True)
+
+
+def test_flash_messages_are_not_cached(admin_client, make_participant):
+    participant_id, _, qr_code = make_participant('Sokol')
+    admin_client.post(f'/admin/participant/{participant_id}/add_achievement',
+                      data={'description': 'Перший політ', 'points': '5'})
+
+    response = admin_client.get(f'/pilot/{qr_code}')
+    assert response.status_code == 200
+    assert 'no-store' in response.headers['Cache-Control']
@@ -0,0 +1,98 @@
+import io
+
+import pytest
+from flask import template_rendered
+
+import app as app_module
+from app import db
+
+
+@pytest.fixture
+def import_csv(flask_app, admin_client):
+    """Отправляет CSV в импорт и возвращает result, переданный в шаблон"""
+    def post(text):
+        rendered = []
+
+        def capture(sender, template, context, **extra):
+            rendered.append(context)
+
+        with template_rendered.connected_to(capture, flask_app):
+            response = admin_client.post('/admin/participants/import',
+                                         data={'file': (io.BytesIO(text.encode('utf-8')), 'members.csv')},
+                                         content_type='multipart/form-data')
+        assert response.status_code == 200
+        return rendered[-1].get('result')
+    return post
+
+
+def imported_participants(flask_app):
+    with flask_app.app_context():
+        return db.session.execute(
+            db.select(app_module.Participant.participant_id, app_module.Participant.callsign)
+            .order_by(app_module.Participant.participant_id)
+        ).all()
+
+
+def test_import_reports_row_errors_and_keeps_valid_rows(flask_app, import_csv, make_participant):
+    make_participant('Taken')
+    result = import_csv(
+        'callsign,category,subcategory,participant_id\n'
+        'Alpha,military,pilot_strike,\n'
+        ',military,pilot_strike,\n'
+        'Bravo,space,pilot,\n'
+        'Charlie,civil,engineer_unknown,\n'
+        'Alpha,civil,pilot,\n'
+        'Taken,civil,pilot,\n'
+        'Delta,civil,pilot,UAV-0100\n'
+        'Echo,civil,pilot,UAV-01\n'
+        'Foxtrot,civil,pilot,\n'
+    )
+
+    assert result['rows'] == 9
+    assert result['imported'] == 3
+    assert result['errors_total'] == 6
+    errors = {line_no: (callsign, error) for line_no, callsign, error in result['errors']}
+    assert errors[3] == ('', 'Не вказано позивний')
+    assert errors[4] == ('Bravo', 'Невідома категорія "space"')
+    assert errors[5][1].startswith('Невідома підкатегорія')
+    assert errors[6] == ('Alpha', 'Позивний повторюється у файлі')
+    assert errors[7] == ('Taken', 'Позивний вже зайнятий')
+    assert errors[9] == ('Echo', 'Неправильний формат ID "UAV-01"')
+
+    # Автоматические ID выдаются после ручного UAV-0100
+    assert imported_participants(flask_app) == [
+        ('UAV-0001', 'Taken'), ('UAV-0100', 'Delta'), ('UAV-0101', 'Alpha'), ('UAV-0102', 'Foxtrot'),
+    ]
+
+
+def test_import_rejects_missing_columns(flask_app, import_csv):
+    assert import_csv('callsign,category\nAlpha,military\n') is None
+    assert imported_participants(flask_app) == []
+
+
+def test_failed_batch_is_reported_and_other_batches_are_saved(flask_app, import_csv, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'IMPORT_BATCH_SIZE', 2)
+    original_bump = app_module.bump_data_version
+    calls = []
+
+    def bump_failing_second_batch():
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('disk full')
+        original_bump()
+
+    monkeypatch.setattr(app_module, 'bump_data_version', bump_failing_second_batch)
+    result = import_csv(
+        'callsign,category,subcategory\n'
+        'A1,civil,pilot\n'
+        'A2,civil,pilot\n'
+        'B1,civil,pilot\n'
+        'B2,civil,pilot\n'
+        'C1,civil,pilot\n'
+    )
+
+    assert result['imported'] == 3
+    assert result['batches'] == 2
+    assert [(line_no, callsign) for line_no, callsign, _ in result['errors']] == [(4, 'B1'), (5, 'B2')]
+    assert all(error.startswith('Пачку не збережено') for _, _, error in result['errors'])
+    assert [callsign for _, callsign in imported_participants(flask_app)] == ['A1', 'A2', 'C1']
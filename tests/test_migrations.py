@@ -0,0 +1,70 @@
+import app as app_module
+from app import db
+
+
+def index_names(table):
+    # Индексы по выражениям inspect() в SQLite не отражает - читаем sqlite_master
+    return set(db.session.execute(
+        db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"), {'table': table}
+    ).scalars())
+
+
+def test_fresh_database_is_at_latest_version(flask_app):
+    with flask_app.app_context():
+        assert app_module.get_schema_version() == app_module.MIGRATIONS[-1][0]
+        assert 'ix_participant_points_id' in index_names('participant')
+        assert 'ix_pilot_points_id' in index_names('pilot')
+        assert 'ix_admin_activity_log_pilot_timestamp_id' in index_names('admin_activity_log')
+        assert app_module.get_search_backend() == 'fts5'
+
+
+def test_migration_steps_are_idempotent(flask_app):
+    with flask_app.app_context():
+        db.session.execute(db.delete(app_module.SchemaVersion).where(app_module.SchemaVersion.version > 1))
+        db.session.commit()
+
+        app_module.migrate_database()
+
+        assert app_module.get_schema_version() == app_module.MIGRATIONS[-1][0]
+        assert db.session.execute(db.select(db.func.count()).select_from(app_module.SchemaVersion)).scalar() == \
+            len(app_module.MIGRATIONS)
+
+
+def test_search_index_falls_back_to_scan(flask_app, monkeypatch):
+    monkeypatch.setattr(app_module, 'sqlite_supports_trigram_index', lambda: False)
+    with flask_app.app_context():
+        db.session.execute(db.text('DROP TABLE member_search'))
+        db.session.execute(db.delete(app_module.SchemaVersion).where(app_module.SchemaVersion.version >= 4))
+        db.session.commit()
+        monkeypatch.setattr(app_module, '_search_backend', None)
+
+        app_module.migrate_database()
+
+        assert app_module.get_schema_version() == app_module.MIGRATIONS[-1][0]
+        monkeypatch.setattr(app_module, '_search_backend', None)
+        assert app_module.get_search_backend() == 'scan'
+
+
+def test_pilot_migration_moves_pilots_and_achievements(flask_app, make_pilot):
+    strike_id, strike_qr = make_pilot('UAV-0001', 'Old-Strike', category='strike', points=7)
+    make_pilot('UAV-0002', 'Old-Recon', category='reconnaissance')
+    with flask_app.app_context():
+        db.session.add(app_module.Achievement(pilot_id=strike_id, description='Архівне', points=7))
+        db.session.commit()
+
+        assert app_module.migrate_pilots_to_participants(chunk_size=1) == 2
+        # Повторный запуск продолжает с отметки и ничего не дублирует
+        assert app_module.migrate_pilots_to_participants(chunk_size=1) == 0
+
+        participants = {p.callsign: p for p in app_module.Participant.query.all()}
+        assert set(participants) == {'Old-Strike', 'Old-Recon'}
+        strike = participants['Old-Strike']
+        assert (strike.participant_id, strike.category, strike.subcategory, strike.qr_code, strike.points) == \
+            ('UAV-0001', 'military', 'pilot_strike', strike_qr, 7)
+        assert participants['Old-Recon'].subcategory == 'pilot_reconnaissance'
+        assert [a.description for a in strike.achievements] == ['Архівне']
+
+        # Мигрированные пилоты больше не видны как отдельные профили
+        stats = app_module.collect_member_stats()
+        assert stats['total_unmigrated_pilots'] == 0
+        assert stats['total_all'] == 2
@@ -0,0 +1,71 @@
+import threading
+
+import app as app_module
+from app import db
+
+
+def test_allocated_numbers_are_unique_across_threads(flask_app):
+    numbers = []
+    errors = []
+
+    def allocate():
+        try:
+            with flask_app.app_context():
+                for _ in range(10):
+                    numbers.extend(app_module.allocate_participant_numbers())
+                    db.session.commit()
+        except Exception as e:  # pragma: no cover - сообщение попадет в assert
+            errors.append(e)
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(numbers) == list(range(1, 41))
+
+
+def test_block_allocation_is_contiguous(flask_app):
+    with flask_app.app_context():
+        assert app_module.allocate_participant_numbers(3) == [1, 2, 3]
+        assert app_module.allocate_participant_numbers(2) == [4, 5]
+        db.session.commit()
+
+
+def test_counter_skips_manually_assigned_ids(flask_app):
+    with flask_app.app_context():
+        app_module.advance_participant_id_counter(41)
+        assert app_module.allocate_participant_numbers() == [42]
+        # Меньший ручной ID счетчик назад не сдвигает
+        app_module.advance_participant_id_counter(7)
+        assert app_module.allocate_participant_numbers() == [43]
+        db.session.commit()
+
+
+def test_allocator_reinitializes_after_rollback(flask_app, monkeypatch):
+    with flask_app.app_context():
+        db.session.execute(db.delete(app_module.IdCounter))
+        db.session.commit()
+    monkeypatch.setattr(app_module, '_id_allocator_ready', False)
+
+    with flask_app.app_context():
+        assert app_module.allocate_participant_numbers() == [1]
+        db.session.rollback()
+        assert app_module._id_allocator_ready is False
+
+        # Строка счетчика откатилась вместе с транзакцией - инициализация повторяется
+        assert app_module.allocate_participant_numbers() == [1]
+        db.session.commit()
+        assert app_module._id_allocator_ready is True
+        assert db.session.get(app_module.IdCounter, app_module.PARTICIPANT_ID_COUNTER).value == 1
+
+
+def test_format_and_parse_participant_id(flask_app):
+    with flask_app.app_context():
+        assert app_module.format_participant_id(7) == 'UAV-0007'
+        assert app_module.parse_participant_number('UAV-0007') == 7
+        assert app_module.parse_participant_number('PILOT-7') is None
+        assert app_module.is_valid_participant_id('UAV-12345')
+        assert not app_module.is_valid_participant_id('UAV-12')
@@ -0,0 +1,99 @@
+import pytest
+from flask import g
+from sqlalchemy import event
+
+import app as app_module
+from app import db
+
+
+@pytest.fixture
+def executed_on(flask_app):
+    """Список (bind, SQL) всех выполненных запросов: None - основная БД, 'replica' - реплика"""
+    statements = []
+    listeners = []
+    with flask_app.app_context():
+        for bind, engine in db.engines.items():
+            def record(conn, cursor, statement, parameters, context, executemany, bind=bind):
+                statements.append((bind, statement))
+            event.listen(engine, 'before_cursor_execute', record)
+            listeners.append((engine, record))
+    yield statements
+    for engine, record in listeners:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def data_reads(statements, bind):
+    """Запросы к bind, кроме проверки версии данных монитором отставания"""
+    return [sql for used_bind, sql in statements if used_bind == bind and 'data_version' not in sql]
+
+
+@pytest.mark.parametrize('sql, is_write', [
+    ('SELECT 1', False),
+    ('  select id from participant', False),
+    ('UPDATE id_counter SET value = value + 1', True),
+    ('CREATE INDEX ix ON participant (points)', True),
+    ("SELECT setval(:seq, :value)", True),
+    ("SELECT nextval(:seq) FROM generate_series(1, :count)", True),
+    ('SELECT NEXTVAL (:seq)', True),
+    ('SELECT next_value FROM settings', False),
+])
+def test_is_write_statement_for_text(sql, is_write):
+    assert app_module.is_write_statement(db.text(sql)) is is_write
+
+
+def test_is_write_statement_for_constructs(flask_app):
+    assert app_module.is_write_statement(db.update(app_module.Participant).values(points=1))
+    assert app_module.is_write_statement(db.insert(app_module.Participant))
+    assert not app_module.is_write_statement(db.select(app_module.Participant.id))
+
+
+def test_public_pages_read_from_replica(client, make_participant, executed_on):
+    make_participant('Sokol', points=10)
+    executed_on.clear()
+
+    assert client.get('/rating').status_code == 200
+    assert data_reads(executed_on, app_module.REPLICA_BIND)
+    assert data_reads(executed_on, None) == []
+
+
+def test_admin_pages_read_from_primary(admin_client, make_participant, executed_on):
+    make_participant('Sokol')
+    executed_on.clear()
+
+    assert admin_client.get('/admin').status_code == 200
+    assert data_reads(executed_on, None)
+    assert data_reads(executed_on, app_module.REPLICA_BIND) == []
+
+
+def test_lagging_replica_falls_back_to_primary(client, make_participant, executed_on, monkeypatch):
+    make_participant('Sokol')
+    monkeypatch.setattr(app_module.replica_lag_monitor, 'check', lambda: False)
+    executed_on.clear()
+
+    assert client.get('/rating').status_code == 200
+    assert data_reads(executed_on, app_module.REPLICA_BIND) == []
+
+
+def test_writes_pin_the_rest_of_the_request_to_primary(flask_app):
+    primary = replica = None
+    with flask_app.test_request_context('/rating'):
+        g.read_bind = app_module.REPLICA_BIND
+        primary, replica = db.engines[None], db.engines[app_module.REPLICA_BIND]
+        select = db.select(app_module.Participant.id)
+
+        assert db.session.get_bind(clause=select) is replica
+        # SELECT nextval/setval меняет последовательность и должен идти в основную БД
+        assert db.session.get_bind(clause=db.text("SELECT setval(:seq, :value)")) is primary
+        assert db.session.get_bind(clause=select) is primary
+        db.session.remove()
+
+
+def test_author_of_a_change_reads_from_primary(admin_client, make_participant, executed_on):
+    participant_id, _, qr_code = make_participant('Sokol')
+    response = admin_client.post(f'/admin/participant/{participant_id}/add_achievement',
+                                 data={'description': 'Перший політ', 'points': '5'})
+    assert response.status_code == 302
+    executed_on.clear()
+
+    assert admin_client.get(f'/pilot/{qr_code}').status_code == 200
+    assert data_reads(executed_on, app_module.REPLICA_BIND) == []